@@ -1,15 +1,16 @@
 
 import * as THREE from 'three';
-import { STLLoader } from 'three/examples/jsm/loaders/STLLoader';
+import { MeshLoader, MESH_ACCEPT } from '../meshLoader.js';
 import { OrbitControls } from 'three/examples/jsm/controls/OrbitControls';
 import { GUI } from 'dat.gui';
 
 const SERVER_URL = "http://api.cosmicimprint.org"
-const ENDPOINT_STL = SERVER_URL + "/planets/stl/latest/";
+// Phones get the planet's lightest level of detail (1/16 of the triangles)
+const ENDPOINT_STL = SERVER_URL + "/planets/stl/latest/?lod=2";
 
 // STL Models
 const canvas = document.getElementById('leftColumnCanvas');
-const loader = new STLLoader();
+const loader = new MeshLoader();
 const scene = new THREE.Scene();
 const camera = new THREE.PerspectiveCamera(75, window.innerWidth / 2 / window.innerHeight, 0.1, 1000);
 const renderer = new THREE.WebGLRenderer({ canvas, alpha: true });
@@ -37,7 +38,7 @@ const LIGHT_DIR_Z = 150;
 
 async function fetchSTLFile(endpoint) {
     try {
-        const response = await fetch(endpoint);
+        const response = await fetch(endpoint, { headers: { Accept: MESH_ACCEPT } });
         if (!response.ok) {
             throw new Error(`Failed to fetch STL file: ${response.statusText}`);
         }
@@ -51,9 +52,7 @@ async function fetchSTLFile(endpoint) {
 function loadSTLIntoScene(blob, scene) {
     if (!blob) return;
 
-    const stl_url = URL.createObjectURL(blob);
-
-    loader.load(stl_url, function (geometry) {
+    loader.loadBlob(blob, function (geometry) {
         const material = new THREE.MeshStandardMaterial({
             color: 0xffffff,
             roughness: 0.5,
@@ -235,6 +234,10 @@ const eventSource = new EventSource(SERVER_URL + "/notifications/");
 
 eventSource.onmessage = (event) => {
     const data = JSON.parse(event.data);
+    // Uploads send one event per pipeline stage; only react to the planet being ready
+    if (data.stage !== "planet") {
+        return;
+    }
     console.log("Push Notification:", data.message);
     alert(`New Notification: ${data.message}`);
     reloadSTLModel();
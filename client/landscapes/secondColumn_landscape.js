@@ -1,5 +1,5 @@
 import * as THREE from 'three';
-import { STLLoader } from 'three/examples/jsm/loaders/STLLoader';
+import { MeshLoader, MESH_ACCEPT } from '../meshLoader.js';
 import { OrbitControls } from 'three/examples/jsm/controls/OrbitControls';
 import { GUI } from 'dat.gui';
 
@@ -9,7 +9,7 @@ const ENDPOINT_STL = SERVER_URL + "/landscape/latest/";
 const canvas = document.getElementById('middleColumnCanvas');
 const container = document.getElementById('middleColumn');
 
-const loader = new STLLoader();
+const loader = new MeshLoader();
 const scene = new THREE.Scene();
 
 // Create camera with correct aspect ratio
@@ -52,7 +52,7 @@ function calculateOptimalOrbitRadius(bbox) {
 
 async function fetchSTLFile(endpoint) {
     try {
-        const response = await fetch(endpoint);
+        const response = await fetch(endpoint, { headers: { Accept: MESH_ACCEPT } });
         if (!response.ok) {
             throw new Error(`Failed to fetch STL file: ${response.statusText}`);
         }
@@ -66,9 +66,7 @@ async function fetchSTLFile(endpoint) {
 function loadSTLIntoScene(blob, scene) {
     if (!blob) return;
 
-    const stl_url = URL.createObjectURL(blob);
-
-    loader.load(stl_url, function (geometry) {
+    loader.loadBlob(blob, function (geometry) {
         geometry.computeBoundingBox();
         geometry.center();
 
@@ -192,6 +190,10 @@ const eventSource = new EventSource(SERVER_URL + "/notifications/");
 
 eventSource.onmessage = (event) => {
     const data = JSON.parse(event.data);
+    // Uploads send one event per pipeline stage; only react to the landscape being ready
+    if (data.stage !== "landscape") {
+        return;
+    }
     console.log("Push Notification:", data.message);
     alert(`New Notification: ${data.message}`);
     reloadSTLModel();
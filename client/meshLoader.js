@@ -0,0 +1,57 @@
+import * as THREE from 'three';
+import { STLLoader } from 'three/examples/jsm/loaders/STLLoader';
+import { GLTFLoader } from 'three/examples/jsm/loaders/GLTFLoader';
+
+export const GLB_MEDIA_TYPE = "model/gltf-binary";
+
+// Ask the server for the compact GLB, falling back to STL for older files
+export const MESH_ACCEPT = `${GLB_MEDIA_TYPE}, application/vnd.ms-pkistl;q=0.9, */*;q=0.1`;
+
+// Loads a mesh blob fetched from the server into a BufferGeometry, whether it
+// came back as GLB (indexed, quantized) or STL
+export class MeshLoader {
+    constructor() {
+        this.stlLoader = new STLLoader();
+        this.gltfLoader = new GLTFLoader();
+    }
+
+    loadBlob(blob, onLoad) {
+        if (!blob.type.startsWith(GLB_MEDIA_TYPE)) {
+            const url = URL.createObjectURL(blob);
+            this.stlLoader.load(url, (geometry) => {
+                URL.revokeObjectURL(url);
+                onLoad(geometry);
+            });
+            return;
+        }
+
+        blob.arrayBuffer()
+            .then((buffer) => this.gltfLoader.parseAsync(buffer, ''))
+            .then((gltf) => onLoad(geometryFromGLTF(gltf)))
+            .catch((error) => console.error("Error parsing GLB file:", error));
+    }
+}
+
+// Bakes the node transform (which undoes the 16-bit quantization) into a
+// plain float geometry, so pages can keep scaling and rotating it as before
+function geometryFromGLTF(gltf) {
+    let mesh = null;
+    gltf.scene.updateMatrixWorld(true);
+    gltf.scene.traverse((object) => {
+        if (!mesh && object.isMesh) mesh = object;
+    });
+
+    const source = mesh.geometry.getAttribute('position');
+    const positions = new Float32Array(source.count * 3);
+    const vertex = new THREE.Vector3();
+    for (let i = 0; i < source.count; i++) {
+        vertex.fromBufferAttribute(source, i).applyMatrix4(mesh.matrixWorld);
+        vertex.toArray(positions, i * 3);
+    }
+
+    const geometry = new THREE.BufferGeometry();
+    geometry.setAttribute('position', new THREE.BufferAttribute(positions, 3));
+    geometry.setIndex(mesh.geometry.getIndex());
+    geometry.computeVertexNormals();
+    return geometry;
+}
@@ -1,6 +1,6 @@
 // Import necessary modules from three.js
 import * as THREE from 'three';
-import { STLLoader } from 'three/examples/jsm/loaders/STLLoader';
+import { MeshLoader, MESH_ACCEPT } from '../../meshLoader.js';
 // import { OrbitControls } from 'three/examples/jsm/controls/OrbitControls';
 import { CSS2DRenderer, CSS2DObject } from 'three/examples/jsm/renderers/CSS2DRenderer';
 import { GUI } from 'dat.gui';
@@ -66,7 +66,7 @@ scene.add(stars);
 // Load the STL model
 const STL_PATH = "./assets/KevinYang_fe5e59a6d3699fd1af0470b1fa5773611_planet.stl"
 // const STL_PATH = "./assets/tiled_sphere_hannah.stl";
-const loader = new STLLoader();
+const loader = new MeshLoader();
 let planet;
 let pointLight;
 let isMousePressed = false;
@@ -81,7 +81,7 @@ const LIGHT_DIR_Z = 150;
 
 async function fetchSTLFile(endpoint) {
     try {
-        const response = await fetch(endpoint);
+        const response = await fetch(endpoint, { headers: { Accept: MESH_ACCEPT } });
         if (!response.ok) {
             throw new Error(`Failed to fetch STL file: ${response.statusText}`);
         }
@@ -96,9 +96,7 @@ async function fetchSTLFile(endpoint) {
 function loadSTLIntoScene(blob, scene) {
     if (!blob) return;
 
-    const stl_url = URL.createObjectURL(blob);
-
-    loader.load(stl_url, function (geometry) {
+    loader.loadBlob(blob, function (geometry) {
         const material = new THREE.MeshStandardMaterial({
             color: 0xffffff,
             roughness: 0.5,
@@ -272,6 +270,10 @@ const eventSource = new EventSource(SERVER_URL + "/notifications/");
 
 eventSource.onmessage = (event) => {
     const data = JSON.parse(event.data);
+    // Uploads send one event per pipeline stage; only react to the planet being ready
+    if (data.stage !== "planet") {
+        return;
+    }
     console.log("Push Notification:", data.message);
     alert(`New Notification: ${data.message}`);
 };
@@ -85,6 +85,28 @@ let data = null;
 // function () {
 
 // }
+const JOB_POLL_INTERVAL = 1000;
+
+// Poll the upload's job until the planet has been generated (or failed)
+async function waitForJob(statusUrl) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL));
+
+        const response = await fetch(statusUrl);
+        if (!response.ok) {
+            throw new Error(`Failed to fetch job status: ${response.statusText}`);
+        }
+
+        const job = await response.json();
+        if (job.status === "failed") {
+            throw new Error(job.error);
+        }
+        if (job.status === "done") {
+            return job.artifacts;
+        }
+    }
+}
+
 // Handle the form submission
 form.addEventListener('submit', async (e) => {
     e.preventDefault();
@@ -106,7 +128,7 @@ form.addEventListener('submit', async (e) => {
         const result = await response.json();
         if (response.ok) {
             responseDiv.innerHTML = `<p style="color: green;">${result.message}</p><p style ="color: white;">Look up! You'll see your imprint on the cosmos shortly.</p>`;
-            data = result.data;
+            data = await waitForJob(SERVER_URL + result.status_url);
         } else {
             responseDiv.innerHTML = `<p style="color: red;">Error: ${result.detail}</p>`;
         }
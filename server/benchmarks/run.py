@@ -0,0 +1,437 @@
+"""
+Benchmarks the pipeline stages on synthetic palms, without a camera or network.
+
+Run it from the server folder:
+
+    python -m benchmarks.run [--only planet] [--tiles 1,10,50,500] [--repeat 3]
+                             [--output after.json] [--baseline before.json]
+
+Every case runs in a fresh worker process, so the peak RSS it reports is its
+own. Meshes are checked against the golden meshes in benchmarks/golden, and
+the run exits with status 1 if one differs (or a case fails), so it doubles as
+a regression gate. `--update-golden` rewrites the golden meshes after a change
+that is meant to alter the geometry.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+
+from benchmarks.synthetic import synthetic_hand, synthetic_heightmap
+
+GOLDEN_FOLDER = Path(__file__).parent / "golden"
+# Triangles kept per golden mesh, spread evenly over the mesh
+GOLDEN_SAMPLES = 1024
+# Largest coordinate difference from a golden mesh (planets have radius 1,
+# landscapes span 0-1 on every axis)
+GOLDEN_TOLERANCE = 1e-4
+
+PALM_SIZE = 640
+PLANET_RADIUS = 1
+PLANET_TILES = 50
+ADAPTIVE_MAX_ERROR = 0.002
+TILE_COUNTS = (1, 10, 50, 500)
+# Landscapes drawn for the tile folders; larger folders repeat them
+TILE_SEEDS = 8
+
+
+class SkipCase(Exception):
+    """Raised when a case cannot run in this environment (not a failure)."""
+
+
+def _landscape(seed, **kwargs):
+    from scripts.landscape import landscape_mesh
+
+    return landscape_mesh(synthetic_heightmap(seed), **kwargs)
+
+
+def _stl_triangles(stl_path):
+    from scripts.stl_io import read_stl
+
+    return np.array(read_stl(stl_path)["vectors"])
+
+
+def _mesh_triangles(vertices, faces):
+    return np.asarray(vertices)[np.asarray(faces)]
+
+
+def tile_folder(workdir: Path, count: int) -> Path:
+    """
+    A landscapes folder of `count` tiles, as the collective planet reads it.
+
+    The planet only places the newest tiles it has slots for, so only those
+    are distinct files; older tiles are hard links to one file, which keeps a
+    500 tile folder small on disk.
+    """
+    from scripts.landscape import save_landscape
+    from scripts.sphere_projection import tiling
+    from scripts.tile_mesh import indexed_path
+
+    folder = workdir / f"tiles_{count}"
+    if folder.exists():
+        return folder
+
+    sources = workdir / "tile_sources"
+    sources.mkdir(exist_ok=True)
+    for seed in range(TILE_SEEDS):
+        source = sources / f"tile_{seed}_landscapes.stl"
+        if not source.exists():
+            save_landscape(source, *_landscape(seed))
+
+    M, N_per_band = tiling(PLANET_TILES)
+    distinct = min(count, M * N_per_band)
+
+    partial = workdir / f".tiles_{count}"
+    shutil.rmtree(partial, ignore_errors=True)
+    partial.mkdir()
+    now = time.time_ns()
+
+    def copy(source, stl_path, mtime):
+        for source_path, path in (
+            (source, stl_path),
+            (indexed_path(source), indexed_path(stl_path)),
+        ):
+            shutil.copyfile(source_path, path)
+            os.utime(path, ns=(mtime, mtime))
+
+    # Tiles are placed by modification time, so give every tile its own
+    old = workdir / f"tiles_{count}_old_landscapes.stl"
+    for i in range(count):
+        stl_path = partial / f"tile_{i:03d}_landscapes.stl"
+        source = sources / f"tile_{i % TILE_SEEDS}_landscapes.stl"
+        if i >= count - distinct:
+            copy(source, stl_path, now - (count - i) * 10**6)
+            continue
+
+        # Links share their modification time, older than any placed tile
+        if not old.exists():
+            copy(source, old, now - (count + 1) * 10**6)
+        os.link(old, stl_path)
+        os.link(indexed_path(old), indexed_path(stl_path))
+
+    partial.rename(folder)
+    return folder
+
+
+# Every case prepares its inputs (untimed) and returns the function to time,
+# its arguments and a function turning the result into (F, 3, 3) triangles,
+# or None for stages that do not make a mesh
+
+
+def palm_case(size):
+    def prepare(workdir):
+        import mediapipe as mp
+
+        from scripts.palm import crop_palm
+
+        if not hasattr(mp, "solutions"):
+            raise SkipCase("this Mediapipe has no hands solution")
+
+        photo = workdir / f"hand_{size[0]}x{size[1]}.jpg"
+        cv2.imwrite(str(photo), synthetic_hand(0, size)[0])
+
+        def detect(photo, size):
+            try:
+                return crop_palm(photo, size)
+            except ValueError as e:
+                # The detector may not take the drawn hand for a hand
+                if str(e).startswith("No hand detected"):
+                    raise SkipCase(str(e)) from e
+                raise
+
+        return detect, (photo, PALM_SIZE), {}, None
+
+    return prepare
+
+
+def heightmap_case(backend):
+    def prepare(workdir):
+        from scripts.heightmap import preprocess_heightmap
+
+        heightmap = synthetic_heightmap(0)
+        return preprocess_heightmap, (heightmap, 5, 20), {"backend": backend}, None
+
+    return prepare
+
+
+def landscape_case(max_error=None):
+    def prepare(workdir):
+        from scripts.landscape import landscape_mesh
+
+        heightmap = synthetic_heightmap(0)
+        kwargs = {"sigma": 5, "margin": 20, "max_error": max_error}
+        return landscape_mesh, (heightmap,), kwargs, lambda mesh: _mesh_triangles(*mesh)
+
+    return prepare
+
+
+def landscape_write_case(workdir):
+    from scripts.landscape import save_landscape
+
+    stl_path = workdir / "landscape_write_landscapes.stl"
+    return save_landscape, (stl_path, *_landscape(0)), {}, None
+
+
+def planet_case(workdir):
+    from scripts.planet_one_palm import tiled_sphere_from_tile
+    from scripts.tile_mesh import indexed_arrays
+
+    stl_path = workdir / "planet_planet.stl"
+    tile = indexed_arrays(*_landscape(0))
+    kwargs = {"R": PLANET_RADIUS, "N": PLANET_TILES}
+    return (
+        tiled_sphere_from_tile,
+        (*tile, stl_path),
+        kwargs,
+        lambda _: _stl_triangles(stl_path),
+    )
+
+
+def collective_case(count):
+    def prepare(workdir):
+        from scripts.planet_multitile import IncrementalTiledSphere
+        from scripts.tile_mesh import tile_cache
+
+        folder = tile_folder(workdir, count)
+        glb_path = workdir / f"collective_{count}.glb"
+
+        def build():
+            tile_cache.clear()  # Every run reads the tiles, as after a restart
+            planet = IncrementalTiledSphere(
+                str(folder), R=PLANET_RADIUS, N=PLANET_TILES
+            )
+            planet.load()
+            planet.export_glb(glb_path)
+            return planet
+
+        def triangles(planet):
+            _, parts = planet.snapshot()
+            return _mesh_triangles(*planet.assemble(parts))
+
+        return build, (), {}, triangles
+
+    return prepare
+
+
+def uv_planet_case(workdir):
+    from scripts.planet import generate_uv_fabric, project_uv_to_sphere
+
+    rows, cols = 2, 3
+    folder = tile_folder(workdir, rows * cols)
+    tiles = {
+        str(i): {"path": str(path)}
+        for i, path in enumerate(sorted(folder.glob("*.stl")))
+    }
+
+    def build():
+        fabric = generate_uv_fabric(tiles, len(tiles), rows, cols)
+        return project_uv_to_sphere(fabric, PLANET_RADIUS, rows, cols)
+
+    return build, (), {}, lambda mesh: _mesh_triangles(mesh.vertices, mesh.faces)
+
+
+class Case(NamedTuple):
+    stage: str
+    prepare: object
+    # Whether the mesh is checked against a golden mesh
+    golden: bool = True
+
+
+def cases(tile_counts=TILE_COUNTS) -> dict:
+    cases = {
+        # Skipped when Mediapipe cannot detect hands, or not the drawn one
+        "palm_1200x900": Case("palm", palm_case((1200, 900))),
+        "palm_4032x3024": Case("palm", palm_case((4032, 3024))),
+        "heightmap_scipy": Case("heightmap", heightmap_case("scipy")),
+        "heightmap_opencv": Case("heightmap", heightmap_case("opencv")),
+        "landscape": Case("landscape", landscape_case()),
+        # Adaptive triangulations can flip with float rounding across platforms
+        "landscape_adaptive": Case(
+            "landscape", landscape_case(ADAPTIVE_MAX_ERROR), golden=False
+        ),
+        "landscape_write": Case("landscape_write", landscape_write_case),
+        "planet": Case("planet", planet_case),
+    }
+    for count in tile_counts:
+        cases[f"collective_{count}"] = Case("collective", collective_case(count))
+    cases["uv_planet"] = Case("uv_planet", uv_planet_case)
+    return cases
+
+
+def golden_sample(triangles: np.ndarray) -> np.ndarray:
+    """An even spread of at most GOLDEN_SAMPLES triangles."""
+    picks = np.linspace(0, len(triangles) - 1, min(len(triangles), GOLDEN_SAMPLES))
+    return np.asarray(triangles[picks.astype(np.intp)], dtype=np.float32)
+
+
+def check_golden(name: str, triangles: np.ndarray, update=False, tolerance=None):
+    """
+    Compares a mesh with its golden mesh (or stores it as the golden mesh).
+
+    Returns:
+        str: "ok", "updated", "missing" or a description of the difference.
+    """
+    tolerance = GOLDEN_TOLERANCE if tolerance is None else tolerance
+    path = GOLDEN_FOLDER / f"{name}.npz"
+    sample = golden_sample(triangles)
+    if update:
+        GOLDEN_FOLDER.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(path, triangles=sample, count=len(triangles))
+        return "updated"
+    if not path.exists():
+        return "missing"
+
+    with np.load(path) as golden:
+        count = int(golden["count"])
+        golden_triangles = golden["triangles"]
+    if count != len(triangles):
+        return f"{len(triangles)} triangles, golden has {count}"
+    difference = float(np.abs(sample - golden_triangles).max(initial=0))
+    if difference > tolerance:
+        return f"off by {difference:.2e}"
+    return "ok"
+
+
+def run_case(name, tile_counts, workdir, repeat=1, update=False, tolerance=None):
+    """Runs one case (in a worker process) and returns its results."""
+    from scripts.metrics import measured
+
+    case = cases(tile_counts)[name]
+    fn, args, kwargs, mesh = case.prepare(Path(workdir))
+
+    durations = []
+    for _ in range(repeat):
+        result, sample = measured(fn, *args, **kwargs)
+        durations.append(sample["duration"])
+
+    record = {
+        "case": name,
+        "stage": case.stage,
+        "median": statistics.median(durations),
+        "min": min(durations),
+        "peak_rss": sample["peak_rss"],
+        "steps": sample["steps"],
+        "triangles": None,
+        "golden": None,
+    }
+    if mesh is not None:
+        triangles = mesh(result)
+        record["triangles"] = len(triangles)
+        if case.golden:
+            record["golden"] = check_golden(name, triangles, update, tolerance)
+    return record
+
+
+def print_record(record, baseline=None):
+    triangles = record["triangles"]
+    line = (
+        f"{record['case']:<20} {record['median']:>9.3f} s {record['min']:>9.3f} s "
+        f"{record['peak_rss'] / 2**20:>7.0f} MiB "
+        f"{'' if triangles is None else triangles:>10}"
+    )
+    if baseline is not None:
+        line += f" {baseline['median'] / record['median']:>6.2f}x"
+    if record["golden"] is not None:
+        line += f"  {record['golden']}"
+    print(line)
+    if record["steps"]:
+        steps = ", ".join(f"{k} {v:.3f} s" for k, v in record["steps"].items())
+        print(f"{'':<20} {steps}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pipeline stages on synthetic palms."
+    )
+    parser.add_argument(
+        "--only", nargs="*", default=None, help="Cases or stages to run."
+    )
+    parser.add_argument(
+        "--tiles",
+        default=",".join(map(str, TILE_COUNTS)),
+        help="Tile counts of the collective planet folders.",
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare with the results in this file.")
+    parser.add_argument(
+        "--update-golden", action="store_true", help="Rewrite the golden meshes."
+    )
+    parser.add_argument("--tolerance", type=float, default=GOLDEN_TOLERANCE)
+    parser.add_argument("--workdir", help="Keep the inputs and outputs here.")
+    args = parser.parse_args(argv)
+
+    tile_counts = tuple(map(int, args.tiles.split(",")))
+    selected = {
+        name: case
+        for name, case in cases(tile_counts).items()
+        if args.only is None or name in args.only or case.stage in args.only
+    }
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {record["case"]: record for record in json.load(f)}
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="conflux-benchmark-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    print(
+        f"{'case':<20} {'median':>11} {'min':>11} {'peak RSS':>11} {'triangles':>10}"
+    )
+    records = []
+    failed = False
+    try:
+        for name, case in selected.items():
+            # A fresh process per case, so the peak RSS is the case's own
+            with ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            ) as pool:
+                future = pool.submit(
+                    run_case,
+                    name,
+                    tile_counts,
+                    workdir,
+                    args.repeat,
+                    args.update_golden,
+                    args.tolerance,
+                )
+                try:
+                    record = future.result()
+                except SkipCase as e:
+                    print(f"{name:<20} skipped: {e}")
+                    continue
+                except Exception as e:
+                    print(f"{name:<20} failed: {type(e).__name__}: {e}")
+                    failed = True
+                    continue
+
+            records.append(record)
+            print_record(record, baseline.get(name))
+            failed |= record["golden"] not in (None, "ok", "updated")
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if any(record["golden"] == "missing" for record in records):
+        print("Record the missing golden meshes with --update-golden.")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(records, f, indent=1)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
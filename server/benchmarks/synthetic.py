@@ -0,0 +1,129 @@
+import cv2
+import numpy as np
+
+# Skin tones to draw hands with, in BGR
+SKIN_TONES = ((141, 170, 224), (105, 140, 198), (71, 99, 141))
+# (base, length, sideways lean) of each finger, in palm half widths
+FINGERS = (
+    (-0.72, 1.5, -0.25),
+    (-0.24, 1.75, -0.08),
+    (0.24, 1.65, 0.08),
+    (0.72, 1.25, 0.25),
+)
+
+
+def _blurred_noise(rng, shape, sigma):
+    noise = rng.standard_normal(shape).astype(np.float32)
+    noise = cv2.GaussianBlur(noise, (0, 0), sigma)
+    return noise / (noise.std() + 1e-6)
+
+
+def _curve(start, control, end, points=32):
+    """A quadratic Bezier curve as an (n, 2) int32 polyline."""
+    t = np.linspace(0, 1, points)[:, None]
+    p0, p1, p2 = (np.asarray(p, dtype=np.float64) for p in (start, control, end))
+    curve = (1 - t) ** 2 * p0 + 2 * (1 - t) * t * p1 + t**2 * p2
+    return np.round(curve).astype(np.int32)
+
+
+def synthetic_hand(seed=0, size=(1200, 900)):
+    """
+    Draws a photo of an open hand, palm to the camera.
+
+    The palm, four fingers and a thumb are drawn in a skin tone over a soft
+    background, with shading towards the outline, the three main palm creases,
+    skin texture and sensor noise. Everything is drawn from `seed`, so the
+    same seed always gives the same photo.
+
+    Parameters:
+        seed (int): Seed of the random placement, tone and texture.
+        size (tuple): (width, height) of the photo.
+
+    Returns:
+        tuple: (image, palm), the BGR uint8 photo and the palm's
+        (centre x, centre y, half width) in pixels.
+    """
+    rng = np.random.default_rng(seed)
+    w, h = size
+
+    # Background: a vertical gradient in a random dark colour
+    shade = np.linspace(0, 1, h, dtype=np.float32)[:, None, None]
+    background = rng.uniform(30, 90, 3).astype(np.float32) + 60 * shade
+    background = np.broadcast_to(background, (h, w, 3))
+
+    s = min(w, h) * rng.uniform(0.14, 0.17)  # Half width of the palm
+    cx, cy = w * rng.uniform(0.45, 0.55), h * rng.uniform(0.58, 0.64)
+    angle = np.deg2rad(rng.uniform(-15, 15))
+    cos, sin = np.cos(angle), np.sin(angle)
+
+    def at(dx, dy):
+        # Palm coordinates (in half widths, y up) to pixels
+        return (
+            int(round(cx + s * (dx * cos + dy * sin))),
+            int(round(cy + s * (dx * sin - dy * cos))),
+        )
+
+    mask = np.zeros((h, w), dtype=np.uint8)
+    cv2.ellipse(
+        mask, at(0, 0), (int(s), int(1.15 * s)), np.rad2deg(angle), 0, 360, 255, -1
+    )
+
+    # Fingers fan out from the top of the palm; OpenCV rounds thick line ends
+    for base, length, spread in FINGERS:
+        length *= rng.uniform(0.95, 1.05)
+        cv2.line(
+            mask,
+            at(base, 0.85),
+            at(base + spread * length, 0.85 + length),
+            255,
+            int(0.42 * s),
+        )
+    cv2.line(mask, at(-0.85, -0.3), at(-1.9, 0.55), 255, int(0.5 * s))  # Thumb
+
+    coverage = cv2.GaussianBlur(mask.astype(np.float32) / 255, (0, 0), 2)[..., None]
+
+    # Shading: darker towards the outline, with mottled skin
+    inside = cv2.distanceTransform(mask, cv2.DIST_L2, 5)
+    lighting = 0.7 + 0.3 * np.minimum(inside / (0.5 * s), 1)
+    lighting *= 1 + 0.04 * _blurred_noise(rng, (h, w), 3)
+
+    # Heart, head and life lines
+    creases = np.zeros((h, w), dtype=np.uint8)
+    for start, control, end in (
+        ((0.95, 0.55), (0.2, 0.35), (-0.6, 0.75)),
+        ((-0.9, 0.35), (-0.1, 0.1), (0.85, -0.05)),
+        ((-0.75, 0.4), (-0.3, -0.4), (-0.15, -1.05)),
+    ):
+        jitter = rng.uniform(-0.08, 0.08, (3, 2))
+        points = [at(*(np.add(p, j))) for p, j in zip((start, control, end), jitter)]
+        cv2.polylines(
+            creases, [_curve(*points)], False, 255, max(2, int(0.03 * s)), cv2.LINE_AA
+        )
+    creases = cv2.GaussianBlur(creases.astype(np.float32) / 255, (0, 0), 1.5)
+    lighting *= 1 - 0.45 * creases
+
+    skin = np.array(SKIN_TONES[rng.integers(len(SKIN_TONES))], dtype=np.float32)
+    hand = skin * lighting[..., None]
+
+    image = (1 - coverage) * background + coverage * hand
+    image += rng.normal(0, 3, image.shape).astype(np.float32)  # Sensor noise
+    return np.clip(image, 0, 255).astype(np.uint8), (cx, cy, s)
+
+
+def synthetic_heightmap(seed=0, size=640):
+    """
+    A greyscale palm like the palm stage cuts out of a photo.
+
+    Parameters:
+        seed (int): Seed of the hand it is cut from (see `synthetic_hand`).
+        size (int): Side in pixels of the square heightmap.
+
+    Returns:
+        numpy.ndarray: (size, size) uint8 image.
+    """
+    image, (cx, cy, s) = synthetic_hand(seed)
+    half = int(1.1 * s)
+    x, y = int(cx), int(cy)
+    palm = image[y - half : y + half, x - half : x + half]
+    palm = cv2.resize(palm, (size, size))
+    return cv2.cvtColor(palm, cv2.COLOR_BGR2GRAY)
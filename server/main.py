@@ -5,22 +5,64 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi import BackgroundTasks
 from fastapi.responses import StreamingResponse
 import asyncio
+from contextlib import asynccontextmanager
 
 from pathlib import Path
-import json
 import hashlib
 from datetime import datetime
 import os
+import uuid
+
+from scripts.palm import crop_palm, save_palm_images, to_camel_case_with_capital
+from scripts.landscape import landscape_mesh, save_landscape
+from scripts.heightmap import BLUR_BACKENDS
+from scripts.planet_one_palm import tiled_sphere_from_tile
+from scripts.planet_multitile import IncrementalTiledSphere
+from scripts.tile_mesh import indexed_arrays, indexed_path, tile_cache
+from scripts.result_cache import ResultCache
+from scripts.jobs import Job, JobRegistry, STAGE_MESSAGES
+from scripts.notifications import NotificationHub
+from scripts.metadata_store import MetadataStore
+from scripts.artifacts import (
+    LatestArtifacts,
+    accepts,
+    artifact_response,
+    etag_matches,
+)
+from scripts.glb import GLB_MEDIA_TYPE, glb_path
+from scripts.lod import LOD_LEVELS, is_lod_path, lod_path
+from scripts.metrics import BYTES_BUCKETS, MetricsRegistry
+from scripts.executor import (
+    PipelineExecutor,
+    PipelineBusyError,
+    PipelineUnavailableError,
+)
+
+from starlette.responses import FileResponse, Response
+
 
-from scripts.palm import extract_palm_region, to_camel_case_with_capital
-from scripts.landscape import generate_3d_mesh_from_heightmap
-from scripts.planet_one_palm import create_tiled_sphere
-from scripts.planet_multitile import create_tiled_sphere_from_folder
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start the workers (and their hand detectors) before the first upload
+    pipeline.start()
+    # Load the collective planet's existing tiles ahead of the first upload
+    collective_loading = asyncio.create_task(
+        pipeline.run_serial("collective", collective_planet.load)
+    )
+    collective_loading.add_done_callback(report_collective_loading)
+    yield
+    collective_loading.cancel()
+    pipeline.shutdown()
+    metadata.close()
 
-from starlette.responses import FileResponse
 
+def report_collective_loading(task: asyncio.Task):
+    """Logs why the collective planet could not be loaded at startup."""
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Could not load the collective planet: {str(task.exception())}")
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for testing purposes
 app.add_middleware(
@@ -33,9 +75,12 @@ app.add_middleware(
 
 # Directory to store uploaded photos and data file
 UPLOAD_FOLDER = "data/images/raw"
+UPLOAD_CHUNK_SIZE = 1 << 20  # Bytes read (and hashed) per step while saving a photo
 PALM_FOLDER = "data/images/palms"
 PALM_NORMAL_FOLDER = PALM_FOLDER + "/normal"
 PALM_GREYSCALE_FOLDER = PALM_FOLDER + "/greyscale"
+DATABASE_FILE = Path("data") / "conflux.db"
+# Metadata files used before the database, imported into it once
 DATA_FILE = Path("data") / "scheme.json"
 PLANETS_FILE = Path("data") / "planet.json"
 
@@ -43,6 +88,52 @@ LANDSCAPES_FOLDER = "data/landscapes"
 
 PLANETS_FOLDER = "data/planets"
 PLANET_FOLDER = "data/planet"
+# The collective planet's STL is generated on request; only its GLB is kept
+COLLECTIVE_PLANET_FILE = Path(PLANET_FOLDER) / "collective_planet.glb"
+
+# Processing pipeline: one worker process (and hand detector) per core by default,
+# a bounded number of uploads in flight and a timeout in seconds for each stage
+PIPELINE_WORKERS = int(os.environ.get("CONFLUX_PIPELINE_WORKERS", os.cpu_count() or 1))
+PIPELINE_MAX_QUEUE = int(
+    os.environ.get("CONFLUX_PIPELINE_MAX_QUEUE", 4 * PIPELINE_WORKERS)
+)
+STAGE_TIMEOUTS = {
+    stage: float(os.environ.get(f"CONFLUX_{stage.upper()}_TIMEOUT", default))
+    for stage, default in {
+        "palm": 30,
+        "landscape": 30,
+        "planet": 60,
+        "collective": 120,
+    }.items()
+}
+# Memory for parsed landscape tiles reused across collective planet builds
+TILE_CACHE_MB = int(os.environ.get("CONFLUX_TILE_CACHE_MB", 512))
+
+# Pipeline parameters; results are cached per photo and per set of parameters
+PALM_SIZE = 640
+LANDSCAPE_SIGMA = 5
+LANDSCAPE_MARGIN = 20
+# Vertical error allowed when triangulating landscapes adaptively; 0 keeps the
+# uniform grid (which the planets' reduced levels of detail rely on)
+LANDSCAPE_MAX_ERROR = float(os.environ.get("CONFLUX_LANDSCAPE_MAX_ERROR", 0)) or None
+# Gaussian blur implementation for the landscape heightmaps (see BLUR_BACKENDS)
+LANDSCAPE_BLUR = os.environ.get("CONFLUX_LANDSCAPE_BLUR", "scipy")
+if LANDSCAPE_BLUR not in BLUR_BACKENDS:
+    raise ValueError(f"CONFLUX_LANDSCAPE_BLUR must be one of {BLUR_BACKENDS}.")
+PLANET_RADIUS = 1
+PLANET_TILES = 50
+PIPELINE_PARAMS = {
+    "version": 3,  # Bump when a stage's output changes for the same parameters
+    "size": PALM_SIZE,
+    "sigma": LANDSCAPE_SIGMA,
+    "margin": LANDSCAPE_MARGIN,
+    "max_error": LANDSCAPE_MAX_ERROR,
+    "blur": LANDSCAPE_BLUR,
+    "R": PLANET_RADIUS,
+    "N": PLANET_TILES,
+}
+RESULT_CACHE_FOLDER = Path("data") / "cache"
+RESULT_CACHE_MB = int(os.environ.get("CONFLUX_RESULT_CACHE_MB", 4096))
 
 # INDEX_PAGE_FILE = Path("index.html")
 # INDEX_PAGE_FILE = Path("docs") / "index.html"
@@ -57,16 +148,72 @@ Path(PLANETS_FOLDER).mkdir(parents=True, exist_ok=True)
 Path(PLANET_FOLDER).mkdir(parents=True, exist_ok=True)
 
 
-event_queue = asyncio.Queue()
+notifications = NotificationHub()
+
+# Pipeline, cache and connection metrics, served at /metrics
+metrics = MetricsRegistry()
+artifact_bytes = metrics.histogram(
+    "conflux_artifact_bytes",
+    "Size of each file announced by the pipeline.",
+    BYTES_BUCKETS,
+)
+metrics.callback(
+    "conflux_sse_subscribers",
+    "Screens connected to the notification stream.",
+    lambda: notifications.subscriber_count,
+)
+
+# Most recent output of each kind, kept up to date by the pipeline
+latest = LatestArtifacts(
+    {
+        "planets": (PLANETS_FOLDER, "*.stl"),
+        "planet": (PLANET_FOLDER, "*.glb"),
+        "palm": (PALM_GREYSCALE_FOLDER, "*.png"),
+        "landscape": (LANDSCAPES_FOLDER, "*.stl"),
+    },
+    exclude=is_lod_path,
+)
+latest.rebuild()
+
+pipeline = PipelineExecutor(
+    PIPELINE_WORKERS, PIPELINE_MAX_QUEUE, STAGE_TIMEOUTS, metrics=metrics
+)
+
+jobs = JobRegistry()
+
+tile_cache.resize(TILE_CACHE_MB * 2**20)
+collective_planet = IncrementalTiledSphere(
+    LANDSCAPES_FOLDER, R=PLANET_RADIUS, N=PLANET_TILES
+)
+
+result_cache = ResultCache(RESULT_CACHE_FOLDER, RESULT_CACHE_MB * 2**20)
 
-# Initialize the JSON data file if it doesn't exist
-if not DATA_FILE.exists():
-    with open(DATA_FILE, "w") as f:
-        json.dump({}, f)
+metrics.callback(
+    "conflux_tile_cache_bytes",
+    "Memory held by parsed landscape tiles.",
+    lambda: tile_cache.nbytes,
+)
+metrics.callback(
+    "conflux_tile_cache_hits_total",
+    "Landscape tiles found in the tile cache.",
+    lambda: tile_cache.hits,
+    kind="counter",
+)
+metrics.callback(
+    "conflux_tile_cache_misses_total",
+    "Landscape tiles read from disk.",
+    lambda: tile_cache.misses,
+    kind="counter",
+)
+metrics.callback(
+    "conflux_result_cache_bytes",
+    "Disk held by cached pipeline results alone (not linked from outputs).",
+    lambda: result_cache.nbytes,
+)
 
-if not PLANETS_FILE.exists():
-    with open(PLANETS_FILE, "w") as f:
-        json.dump({}, f)
+# Open the metadata database, importing the legacy JSON files until that succeeds
+metadata = MetadataStore(DATABASE_FILE)
+metadata.import_legacy(DATA_FILE, PLANETS_FILE)
 
 # if not INDEX_PAGE_FILE.exists():
 #     raise FileNotFoundError(f"File not found: {INDEX_PAGE_FILE}")
@@ -90,137 +237,347 @@ async def upload_file(
     file: UploadFile = File(...),
 ):
     try:
-        client_ip = request.client.host
-        file_content = await file.read()
-        file_hash = hashlib.md5(file_content).hexdigest()
-
-        # Capitalize first letter and convert to CamelCase
-        capitalized_name = to_camel_case_with_capital(name)
-        hashed_filename = f"{capitalized_name}_{file_hash}{Path(file.filename).suffix}"
-
-        # Load existing data
-        with open(DATA_FILE, "r") as f:
-            data = json.load(f)
-            if not isinstance(data, dict):
-                raise ValueError("data.json is not a dictionary!")
-
-        with open(PLANETS_FILE, "r") as f:
-            planet_data = json.load(f)
-            if not isinstance(planet_data, dict):
-                raise ValueError("planet.json is not a dictionary!")
-
-        # Check if client IP already exists and delete the old file if necessary
-        if client_ip in data:
-            old_file_path = data[client_ip]["photo"]
-            old_file = Path(old_file_path)
-            if old_file.exists():
-                old_file.unlink()  # Delete the old file
-
-        # Save the new file
-        file_location = Path(UPLOAD_FOLDER) / hashed_filename
-        with open(file_location, "wb") as buffer:
-            buffer.write(file_content)
-
-        palm_normal_file_location = Path(PALM_NORMAL_FOLDER) / hashed_filename.replace(
-            Path(file.filename).suffix, "_palm_normal.png"
+        pipeline.reserve()
+    except PipelineBusyError as e:
+        raise HTTPException(
+            status_code=429, detail=str(e), headers={"Retry-After": "10"}
         )
-        palm_greyscale_file_location = Path(
-            PALM_GREYSCALE_FOLDER
-        ) / hashed_filename.replace(Path(file.filename).suffix, "_palm_greyscale.png")
+    except PipelineUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
+    try:
+        client_ip = request.client.host
+
+        # Spool the photo to disk in chunks, hashing it on the way (off the
+        # event loop); its final name includes the hash, so it is renamed once
+        # fully written
+        partial_location = Path(UPLOAD_FOLDER) / f".{uuid.uuid4().hex}.part"
         try:
-            extract_palm_region(
-                file_location,
-                palm_normal_file_location,
-                palm_greyscale_file_location,
-                640,
+            file_hash = await asyncio.to_thread(
+                spool_upload, file.file, partial_location
             )
-        except ValueError as e:
-            # Delete the raw file if processing fails
-            if file_location.exists():
-                file_location.unlink()
-            raise HTTPException(status_code=400, detail=str(e))
-
-        landscapes_file_location = Path(LANDSCAPES_FOLDER) / hashed_filename.replace(
-            Path(file.filename).suffix, "_landscapes.stl"
-        )
 
-        planets_file_location = Path(PLANETS_FOLDER) / hashed_filename.replace(
-            Path(file.filename).suffix, "_planet.stl"
+            # Capitalize first letter and convert to CamelCase
+            capitalized_name = to_camel_case_with_capital(name)
+            hashed_filename = (
+                f"{capitalized_name}_{file_hash}{Path(file.filename).suffix}"
+            )
+
+            # Check if client IP already exists and delete the old file if necessary
+            old_entry = metadata.get(client_ip)
+            if old_entry is not None:
+                old_file_path = old_entry["photo"]
+                old_file = Path(old_file_path)
+                if old_file.exists():
+                    old_file.unlink()  # Delete the old file
+
+            # Save the new file
+            file_location = Path(UPLOAD_FOLDER) / hashed_filename
+            os.replace(partial_location, file_location)
+        finally:
+            partial_location.unlink(missing_ok=True)
+
+        job = jobs.create(name, client_ip)
+
+    except Exception as e:
+        pipeline.release()
+        print(f"An error occurred: {str(e)}")  # Log error details
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+    # Generate the meshes after responding so slow connections don't time out
+    background_tasks.add_task(
+        run_upload_job, job, file_location, Path(file.filename).suffix, file_hash
+    )
+
+    return JSONResponse(
+        content={
+            "UUID": client_ip,
+            "job_id": job.id,
+            "status_url": f"/jobs/{job.id}",
+            "message": "File uploaded successfully! Your planet is being generated.",
+            "job": job.to_dict(),
+        },
+        status_code=202,
+    )
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    return job.to_dict()
+
+
+def announce_stage(job: Job, stage: str, **artifacts):
+    """Records a finished stage on the job and notifies the display screens."""
+    job.complete_stage(stage, **artifacts)
+    for artifact, path in artifacts.items():
+        try:
+            artifact_bytes.observe(Path(path).stat().st_size, artifact=artifact)
+        except OSError:
+            pass
+    notifications.publish(
+        {
+            "job_id": job.id,
+            "name": job.name,
+            "stage": stage,
+            "message": STAGE_MESSAGES[stage],
+            "artifacts": dict(job.artifacts),
+        }
+    )
+
+
+def spool_upload(source, destination: Path) -> str:
+    """Copies an uploaded file to `destination` in chunks and returns its MD5."""
+    file_md5 = hashlib.md5()
+    with open(destination, "wb") as buffer:
+        while chunk := source.read(UPLOAD_CHUNK_SIZE):
+            file_md5.update(chunk)
+            buffer.write(chunk)
+    return file_md5.hexdigest()
+
+
+async def run_upload_job(job: Job, file_location: Path, suffix: str, file_hash: str):
+    try:
+        job.start()
+        await process_upload(job, file_location, suffix, file_hash)
+        job.finish()
+
+    except Exception as e:
+        print(f"An error occurred in job {job.id}: {str(e)}")  # Log error details
+        job.fail(str(e))
+        notifications.publish(
+            {
+                "job_id": job.id,
+                "name": job.name,
+                "stage": "failed",
+                "message": str(e),
+            }
         )
 
-        planet_file_location = Path(PLANET_FOLDER) / hashed_filename.replace(
-            Path(file.filename).suffix, "_planet.stl"
+    finally:
+        pipeline.release()
+
+
+async def process_upload(job: Job, file_location: Path, suffix: str, file_hash: str):
+    hashed_filename = file_location.name
+
+    palm_normal_file_location = Path(PALM_NORMAL_FOLDER) / hashed_filename.replace(
+        suffix, "_palm_normal.png"
+    )
+    palm_greyscale_file_location = Path(
+        PALM_GREYSCALE_FOLDER
+    ) / hashed_filename.replace(suffix, "_palm_greyscale.png")
+
+    landscapes_file_location = Path(LANDSCAPES_FOLDER) / hashed_filename.replace(
+        suffix, "_landscapes.stl"
+    )
+
+    planets_file_location = Path(PLANETS_FOLDER) / hashed_filename.replace(
+        suffix, "_planet.stl"
+    )
+
+    # Every file the palm -> planet stages write (twins after their STL, and
+    # reduced levels of detail after the full planet)
+    outputs = {
+        "palm_normal": palm_normal_file_location,
+        "palm_greyscale": palm_greyscale_file_location,
+        "landscape": landscapes_file_location,
+        "landscape_indexed": indexed_path(landscapes_file_location),
+        "landscape_glb": glb_path(landscapes_file_location),
+        "planet": planets_file_location,
+        "planet_glb": glb_path(planets_file_location),
+    }
+    # Adaptively triangulated landscapes are not on a grid to decimate
+    for lod in LOD_LEVELS[1:] if LANDSCAPE_MAX_ERROR is None else ():
+        lod_file_location = lod_path(planets_file_location, lod)
+        outputs[f"planet_lod{lod}"] = lod_file_location
+        outputs[f"planet_lod{lod}_glb"] = glb_path(lod_file_location)
+    cache_key = ResultCache.key(file_hash, PIPELINE_PARAMS)
+
+    # Linking (and evicting) cached files blocks, so keep it off the event loop
+    if await asyncio.to_thread(result_cache.restore, cache_key, outputs):
+        # The same photo was processed before: reuse its palm, landscape and planet
+        job.cached = True
+        latest.update("palm", palm_greyscale_file_location)
+        announce_stage(
+            job,
+            "palm",
+            palm_normal_photo=palm_normal_file_location,
+            palm_greyscale_photo=palm_greyscale_file_location,
         )
+        latest.update("landscape", landscapes_file_location)
+        announce_stage(job, "landscape", landscapes=landscapes_file_location)
+        latest.update("planets", planets_file_location)
+        announce_stage(job, "planet", planet=planets_file_location)
+    else:
+        # Old outputs may be hard links into the cache, so replace them, never overwrite
+        for path in outputs.values():
+            path.unlink(missing_ok=True)
 
         try:
-            generate_3d_mesh_from_heightmap(
+            await run_stages(
+                job,
+                file_location,
+                palm_normal_file_location,
                 palm_greyscale_file_location,
                 landscapes_file_location,
-                sigma=5,
-                margin=20,
-            )
-            create_tiled_sphere(
-                landscapes_file_location, planets_file_location, R=1, N=50
-            )
-            create_tiled_sphere_from_folder(
-                LANDSCAPES_FOLDER, planet_file_location, R=1, N=50
+                planets_file_location,
             )
+        except Exception:
+            # The outputs were deleted, so earlier entries may now hold the only copy
+            await asyncio.to_thread(result_cache.release, file_hash)
+            raise
 
+        try:
+            await asyncio.to_thread(result_cache.store, cache_key, outputs)
         except Exception as e:
-            # Delete the raw file if processing fails
-            if file_location.exists():
-                file_location.unlink()
-            if palm_normal_file_location.exists():
-                palm_normal_file_location.unlink()
-            if palm_greyscale_file_location.exists():
-                palm_greyscale_file_location.unlink()
-            raise HTTPException(status_code=400, detail=str(e))
-
-        # Add or overwrite the client's entry
-        timestamp = datetime.utcnow().isoformat()  # Convert datetime to string
-        new_entry = {
-            "name": name,
-            "photo": str(file_location),
-            "palm_normal_photo": str(palm_normal_file_location),
-            "palm_greyscale_photo": str(palm_greyscale_file_location),
-            "timestamp": timestamp,  # Already a string
-            "landscapes": str(landscapes_file_location),
-        }
-        data[client_ip] = new_entry
+            print(f"Could not cache the results of job {job.id}: {str(e)}")
+
+    try:
+        await pipeline.run_serial(
+            "collective",
+            collective_planet.update,
+            landscapes_file_location,
+            COLLECTIVE_PLANET_FILE,
+        )
+        latest.update("planet", COLLECTIVE_PLANET_FILE)
+        announce_stage(job, "collective", collective_planet=COLLECTIVE_PLANET_FILE)
 
-        # Save updated data
-        with open(DATA_FILE, "w") as f:
-            json.dump(data, f, indent=4)
+    except Exception:
+        delete_upload_files(
+            file_location, palm_normal_file_location, palm_greyscale_file_location
+        )
+        await asyncio.to_thread(result_cache.release, file_hash)
+        raise
+
+    # Add or overwrite the client's entry
+    timestamp = datetime.utcnow().isoformat()  # Convert datetime to string
+    new_entry = {
+        "name": job.name,
+        "photo": str(file_location),
+        "palm_normal_photo": str(palm_normal_file_location),
+        "palm_greyscale_photo": str(palm_greyscale_file_location),
+        "timestamp": timestamp,  # Already a string
+        "landscapes": str(landscapes_file_location),
+    }
+    metadata.put(job.client_ip, new_entry)
+
+
+def delete_upload_files(*paths: Path):
+    """Deletes the raw photo and palm images of an upload that failed."""
+    for path in paths:
+        if path.exists():
+            path.unlink()
+
+
+async def run_stages(
+    job: Job,
+    file_location: Path,
+    palm_normal_file_location: Path,
+    palm_greyscale_file_location: Path,
+    landscapes_file_location: Path,
+    planets_file_location: Path,
+):
+    """
+    Runs the palm, landscape and planet stages on the worker processes.
 
-        background_tasks.add_task(event_queue.put, new_entry)
+    Each stage gets the previous stage's arrays in memory rather than reading
+    its files back. The files are written behind the pipeline, and a stage is
+    announced once its files are on disk.
+    """
+    try:
+        palm, greyscale_palm = await pipeline.run_stage(
+            "palm", crop_palm, file_location, PALM_SIZE
+        )
+    except Exception:
+        # Delete the raw file if processing fails
+        delete_upload_files(file_location)
+        raise
 
-        return JSONResponse(
-            content={
-                "UUID": client_ip,
-                "message": "File uploaded and processed successfully!",
-                "data": new_entry,
-            },
-            status_code=200,
+    try:
+        palm_written = pipeline.write_behind(
+            "palm_write",
+            save_palm_images,
+            palm,
+            greyscale_palm,
+            palm_normal_file_location,
+            palm_greyscale_file_location,
+        )
+        landscape = asyncio.ensure_future(
+            pipeline.run_stage(
+                "landscape",
+                landscape_mesh,
+                greyscale_palm,
+                sigma=LANDSCAPE_SIGMA,
+                margin=LANDSCAPE_MARGIN,
+                max_error=LANDSCAPE_MAX_ERROR,
+                blur=LANDSCAPE_BLUR,
+            )
+        )
+        try:
+            await palm_written
+        except Exception:
+            landscape.cancel()
+            raise
+
+        latest.update("palm", palm_greyscale_file_location)
+        announce_stage(
+            job,
+            "palm",
+            palm_normal_photo=palm_normal_file_location,
+            palm_greyscale_photo=palm_greyscale_file_location,
         )
 
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")  # Log error details
-        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+        vertices, faces = await landscape
+        # The planets get the tile exactly as it is read back from disk
+        tile_vertices, tile_faces = indexed_arrays(vertices, faces)
+        landscape_written = pipeline.write_behind(
+            "landscape_write", save_landscape, landscapes_file_location, vertices, faces
+        )
+        planet = asyncio.ensure_future(
+            pipeline.run_stage(
+                "planet",
+                tiled_sphere_from_tile,
+                tile_vertices,
+                tile_faces,
+                planets_file_location,
+                R=PLANET_RADIUS,
+                N=PLANET_TILES,
+            )
+        )
+        try:
+            await landscape_written
+        except Exception:
+            planet.cancel()
+            raise
+
+        # Spare the collective planet from reading the new tile back
+        tile_cache.put(landscapes_file_location, tile_vertices, tile_faces)
+        latest.update("landscape", landscapes_file_location)
+        announce_stage(job, "landscape", landscapes=landscapes_file_location)
+
+        await planet
+        latest.update("planets", planets_file_location)
+        announce_stage(job, "planet", planet=planets_file_location)
+
+    except Exception:
+        # Delete the raw file if processing fails
+        delete_upload_files(
+            file_location, palm_normal_file_location, palm_greyscale_file_location
+        )
+        raise
 
 
-@app.get("landscape/stl/{client_ip}")
+@app.get("/landscape/stl/{client_ip}")
 async def get_client_stl(client_ip: str):
     try:
-        with open(DATA_FILE, "r") as f:
-            data = json.load(f)
-            if not isinstance(data, dict):
-                raise ValueError("data.json is not a dictionary!")
-
-        if client_ip not in data:
+        client_data = metadata.get(client_ip)
+        if client_data is None:
             raise HTTPException(status_code=404, detail="Client not found.")
 
-        client_data = data[client_ip]
         landscapes_file_location = Path(client_data["landscapes"])
 
         if not landscapes_file_location.exists():
@@ -232,105 +589,91 @@ async def get_client_stl(client_ip: str):
             filename=landscapes_file_location.name,
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
-@app.get("/planets/stl/latest")
-async def get_latest_stl():
-    try:
-        # Get all .stl files in the LANDSCAPES_FOLDER
-        stl_files = list(Path(PLANETS_FOLDER).glob("*.stl"))
+STL_MEDIA_TYPE = "application/vnd.ms-pkistl"
 
-        if not stl_files:
-            raise HTTPException(status_code=404, detail="No STL files found.")
 
-        # Find the latest .stl file based on modification time
-        latest_stl = max(stl_files, key=os.path.getmtime)
-
-        return FileResponse(
-            latest_stl, media_type="application/vnd.ms-pkistl", filename=latest_stl.name
+def check_lod(lod: int):
+    if lod not in LOD_LEVELS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown level of detail, expected one of {list(LOD_LEVELS)}.",
         )
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
-
-
-@app.get("/planet/latest")
-async def get_latest_planet():
-    try:
-        stl_files = list(Path(PLANET_FOLDER).glob("*.stl"))
 
-        if not stl_files:
-            raise HTTPException(status_code=404, detail="No STL files found.")
+def serve_latest(request: Request, kind: str, media_type: str, lod: int = 0):
+    artifact = latest.get(kind)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="No files found.")
 
-        latest_stl = max(stl_files, key=os.path.getmtime)
+    # Planets older than their levels of detail are only available in full
+    if lod:
+        artifact = artifact.sibling(lod_path(artifact.path, lod)) or artifact
 
-        return FileResponse(
-            latest_stl, media_type="application/vnd.ms-pkistl", filename=latest_stl.name
-        )
+    if media_type != STL_MEDIA_TYPE:
+        return artifact_response(request, artifact, media_type)
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+    # Meshes also exist as indexed, quantized GLB for clients that ask for it
+    compact = artifact.variant(".glb")
+    if compact is not None and accepts(request, GLB_MEDIA_TYPE):
+        return artifact_response(request, compact, GLB_MEDIA_TYPE, vary="Accept")
 
+    return artifact_response(request, artifact, media_type, vary="Accept")
 
-@app.get("/palm/latest")
-async def get_latest_palm():
-    try:
-        # Get all .images files in the PALM_GREYSCALE_FOLDER
-        grey_images = list(Path(PALM_GREYSCALE_FOLDER).glob("*.png"))
 
-        if not grey_images:
-            raise HTTPException(status_code=404, detail="No images files found.")
+@app.get("/planets/stl/latest")
+async def get_latest_stl(request: Request, lod: int = 0):
+    check_lod(lod)
+    return serve_latest(request, "planets", STL_MEDIA_TYPE, lod)
 
-        # Find the latest .stl file based on modification time
-        latest_image = max(grey_images, key=os.path.getmtime)
 
-        return FileResponse(
-            latest_image, media_type="image/png", filename=latest_image.name
+@app.get("/planet/latest")
+async def get_latest_planet(request: Request, lod: int = 0):
+    check_lod(lod)
+    compact = latest.get("planet")
+    if compact is not None and lod:
+        compact = compact.sibling(lod_path(compact.path, lod)) or compact
+    if compact is not None and accepts(request, GLB_MEDIA_TYPE):
+        return artifact_response(request, compact, GLB_MEDIA_TYPE, vary="Accept")
+
+    if not collective_planet.loaded:
+        raise HTTPException(
+            status_code=503,
+            detail="The collective planet is still loading.",
+            headers={"Retry-After": "5"},
         )
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+    # Generate the STL from the planet in memory while it is being sent
+    etag, size, chunks = collective_planet.stl_stream(lod)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
 
+    filename = lod_path("collective_planet.stl", lod).name
+    headers["Content-Length"] = str(size)
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return StreamingResponse(chunks, media_type=STL_MEDIA_TYPE, headers=headers)
 
-@app.get("/planet/stl/latest")
-async def get_latest_stl():
-    try:
-        # Get all .stl files in the LANDSCAPES_FOLDER
-        stl_files = list(Path(PLANETS_FOLDER).glob("*.stl"))
-
-        if not stl_files:
-            raise HTTPException(status_code=404, detail="No STL files found.")
 
-        # Find the latest .stl file based on modification time
-        latest_stl = max(stl_files, key=os.path.getmtime)
+@app.get("/palm/latest")
+async def get_latest_palm(request: Request):
+    return serve_latest(request, "palm", "image/png")
 
-        return FileResponse(
-            latest_stl, media_type="application/vnd.ms-pkistl", filename=latest_stl.name
-        )
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+@app.get("/planet/stl/latest")
+async def get_latest_planet_stl(request: Request, lod: int = 0):
+    check_lod(lod)
+    return serve_latest(request, "planets", STL_MEDIA_TYPE, lod)
 
 
 @app.get("/landscape/latest")
-async def get_latest_planet():
-    try:
-        # Get all .json files in the PLANET_FOLDER
-        landscapes = list(Path(LANDSCAPES_FOLDER).glob("*.stl"))
-
-        # Find the latest .json file based on modification time
-        latest_landscape = max(landscapes, key=os.path.getmtime)
-
-        return FileResponse(
-            latest_landscape,
-            media_type="application/json",
-            filename=latest_landscape.name,
-        )
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+async def get_latest_landscape(request: Request):
+    return serve_latest(request, "landscape", STL_MEDIA_TYPE)
 
 
 @app.get("/favicon.ico")
@@ -339,13 +682,17 @@ async def favicon():
 
 
 @app.get("/notifications/")
-async def event_stream():
-    async def event_generator():
-        while True:
-            event = await event_queue.get()
-            yield f"data: {event}\n\n"
+async def event_stream(request: Request):
+    return StreamingResponse(
+        notifications.stream(request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+@app.get("/metrics")
+async def get_metrics():
+    return Response(metrics.render(), media_type=MetricsRegistry.CONTENT_TYPE)
 
 
 # Serve static files (e.g., uploaded images)
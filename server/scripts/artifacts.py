@@ -0,0 +1,168 @@
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional
+
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+
+
+class Artifact:
+    """A generated file together with the validators used for HTTP caching."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        stat = self.path.stat()
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+
+    def is_current(self) -> bool:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return False
+        return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"' == self.etag
+
+    def variant(self, suffix: str) -> "Artifact":
+        """
+        Returns the same output in another format (a sibling file with the given
+        suffix), or None if it is missing or older than this file.
+        """
+        return self.sibling(self.path.with_suffix(suffix))
+
+    def sibling(self, path: Path) -> "Artifact":
+        """
+        Returns another file written along with this one, or None if it is
+        missing or older than this file.
+        """
+        try:
+            sibling = Artifact(path)
+        except FileNotFoundError:
+            return None
+        return sibling if sibling.mtime >= self.mtime else None
+
+
+class LatestArtifacts:
+    """
+    Remembers the most recent file of each artifact kind.
+
+    The pipeline calls `update` whenever it writes an output, so the /latest
+    endpoints no longer glob and stat whole folders on every request. The
+    folders are only scanned once at startup, or again for a kind whose
+    latest file was deleted or replaced outside the pipeline. A kind with no
+    file yet is scanned again only once its folder has changed.
+    """
+
+    def __init__(self, kinds: dict, exclude=None):
+        # kind -> (folder, glob pattern)
+        self.kinds = kinds
+        # Files matching the pattern that are never the latest, e.g. reduced copies
+        self.exclude = exclude
+        self._latest = {}
+        # kind -> modification time of its folder when it was last scanned
+        self._scanned = {}
+
+    def _folder_mtime(self, kind: str):
+        try:
+            return os.stat(self.kinds[kind][0]).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def rebuild(self, kind: str = None):
+        for name in [kind] if kind else self.kinds:
+            folder, pattern = self.kinds[name]
+            # Taken before the scan, so a file added meanwhile is found next time
+            self._scanned[name] = self._folder_mtime(name)
+            files = [
+                path
+                for path in Path(folder).glob(pattern)
+                if self.exclude is None or not self.exclude(path)
+            ]
+            self._latest[name] = (
+                Artifact(max(files, key=os.path.getmtime)) if files else None
+            )
+
+    def update(self, kind: str, path: Path):
+        self._latest[kind] = Artifact(path)
+
+    def get(self, kind: str) -> Artifact:
+        artifact = self._latest.get(kind)
+        if artifact is None:
+            # Files are added to and removed from the folder itself, which
+            # updates its modification time
+            if self._folder_mtime(kind) != self._scanned.get(kind, -1):
+                self.rebuild(kind)
+                artifact = self._latest[kind]
+        elif not artifact.is_current():
+            self.rebuild(kind)
+            artifact = self._latest[kind]
+        return artifact
+
+
+def accepts(request: Request, media_type: str) -> bool:
+    """Whether the request's Accept header explicitly asks for `media_type`."""
+    for accepted in request.headers.get("accept", "").split(","):
+        name, *params = [part.strip() for part in accepted.split(";")]
+        if name.lower() != media_type:
+            continue
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def etag_matches(request: Request, etag: str) -> Optional[bool]:
+    """Whether the request's If-None-Match names `etag`; None without the header."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return None
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def not_modified(request: Request, artifact: Artifact) -> bool:
+    """Checks the request's If-None-Match / If-Modified-Since against the artifact."""
+    matches = etag_matches(request, artifact.etag)
+    if matches is not None:
+        return matches
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(artifact.mtime) <= since
+
+    return False
+
+
+def artifact_response(
+    request: Request, artifact: Artifact, media_type: str, vary: str = None
+):
+    """Serves an artifact, or an empty 304 when the client's copy is current."""
+    headers = {
+        "ETag": artifact.etag,
+        "Last-Modified": artifact.last_modified,
+        # Let clients keep the file but check back before reusing it
+        "Cache-Control": "no-cache",
+    }
+    if vary:
+        headers["Vary"] = vary
+
+    if not_modified(request, artifact):
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(
+        artifact.path,
+        media_type=media_type,
+        filename=artifact.path.name,
+        headers=headers,
+    )
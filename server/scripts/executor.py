@@ -0,0 +1,219 @@
+import asyncio
+import functools
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from scripts.hands_pool import init_hands_pool
+from scripts.metrics import BYTES_BUCKETS, MetricsRegistry, measured
+
+
+class PipelineBusyError(Exception):
+    """Raised when an upload is refused because the pipeline queue is full."""
+
+
+class PipelineUnavailableError(Exception):
+    """Raised when the worker pool is not running or has crashed."""
+
+
+class StageTimeoutError(Exception):
+    """Raised when a pipeline stage does not finish within its timeout."""
+
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(f"Stage '{stage}' did not finish within {timeout} seconds.")
+        self.stage = stage
+        self.timeout = timeout
+
+
+def _init_worker():
+    # Each worker process handles one stage at a time, so one detector is enough
+    init_hands_pool(1)
+
+
+def _warm_up():
+    return True
+
+
+class PipelineExecutor:
+    """
+    Runs the CPU-bound palm -> landscape -> planet stages in a process pool.
+
+    Uploads must be reserved before they run: at most `max_queue` uploads may
+    be in flight (running or waiting for a worker) at once, and further ones
+    are refused with PipelineBusyError instead of piling up. Each stage is
+    awaited with its own timeout so a stuck stage cannot hold a request forever.
+
+    Stages that keep state in the server process (the collective planet) run
+    one at a time on a single background thread instead, via `run_serial`.
+
+    Stages hand their results to the next one in memory; `write_behind` saves
+    those results to disk on a small thread pool while the next stage already
+    runs, so PNG and STL encoding stay off the critical path.
+
+    Every stage and write is measured where it runs (see `measured`) and
+    recorded in `metrics`, labelled with its stage name.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        max_queue: int,
+        stage_timeouts: dict,
+        metrics: MetricsRegistry = None,
+    ):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.stage_timeouts = stage_timeouts
+        self._pool = None
+        self._serial = None
+        self._writer = None
+        self._pending = 0
+
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self._durations = self.metrics.histogram(
+            "conflux_stage_duration_seconds", "Time spent running each stage."
+        )
+        self._waits = self.metrics.histogram(
+            "conflux_stage_wait_seconds",
+            "Time each stage waited for a free worker or thread.",
+        )
+        self._steps = self.metrics.histogram(
+            "conflux_stage_step_duration_seconds",
+            "Time spent in the timed steps of each stage.",
+        )
+        self._peak_rss = self.metrics.histogram(
+            "conflux_stage_peak_rss_bytes",
+            "Peak resident memory of the process that ran each stage, after it.",
+            BYTES_BUCKETS,
+        )
+        self._result_bytes = self.metrics.histogram(
+            "conflux_stage_result_bytes",
+            "Size of the arrays each stage hands to the next.",
+            BYTES_BUCKETS,
+        )
+        self._failures = self.metrics.counter(
+            "conflux_stage_failures_total", "Stages that raised or timed out."
+        )
+        self.metrics.callback(
+            "conflux_pipeline_pending",
+            "Uploads in flight, running or waiting for a worker.",
+            lambda: self.pending,
+        )
+        self.metrics.callback(
+            "conflux_pipeline_max_queue",
+            "Uploads allowed in flight before new ones are refused.",
+            lambda: self.max_queue,
+        )
+        self.metrics.callback(
+            "conflux_pipeline_workers", "Worker processes.", lambda: self.max_workers
+        )
+
+    def start(self):
+        self._serial = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="pipeline-serial"
+        )
+        self._writer = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="pipeline-writer"
+        )
+        self._start_pool()
+
+    def _start_pool(self):
+        # Spawn rather than fork: the server process already runs threads
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        # Bring the workers up now so the first uploads skip model loading
+        for _ in range(self.max_workers):
+            self._pool.submit(_warm_up)
+
+    def shutdown(self):
+        if self._serial is not None:
+            self._serial.shutdown(wait=False, cancel_futures=True)
+            self._serial = None
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)  # Let pending artifacts reach the disk
+            self._writer = None
+        self._shutdown_pool()
+
+    def _shutdown_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    @property
+    def pending(self) -> int:
+        """Number of uploads currently reserved."""
+        return self._pending
+
+    def reserve(self):
+        """Reserves a place in the pipeline queue for one upload, or refuses it."""
+        if self._pool is None:
+            raise PipelineUnavailableError("The processing pipeline is not running.")
+        if self._pending >= self.max_queue:
+            raise PipelineBusyError("Too many uploads in progress, try again shortly.")
+
+        self._pending += 1
+
+    def release(self):
+        """Frees the place taken by `reserve` once the upload has finished."""
+        self._pending -= 1
+
+    async def run_stage(self, stage: str, fn, *args, **kwargs):
+        """Runs one stage in the worker pool and waits for it without blocking the event loop."""
+        try:
+            return await self._run(self._pool, stage, fn, *args, **kwargs)
+        except BrokenProcessPool:
+            # A dead worker poisons the whole pool, so replace it for later uploads
+            self._shutdown_pool()
+            self._start_pool()
+            raise PipelineUnavailableError("A pipeline worker crashed.")
+
+    async def run_serial(self, stage: str, fn, *args, **kwargs):
+        """Runs one stage on the serial thread, after any stage queued before it."""
+        return await self._run(self._serial, stage, fn, *args, **kwargs)
+
+    def write_behind(self, stage: str, fn, *args, **kwargs) -> asyncio.Future:
+        """
+        Starts saving a stage's results on the writer threads.
+
+        Returns a future to await before the files are announced; the caller
+        goes on with the next stage meanwhile.
+        """
+        return asyncio.ensure_future(
+            self._run(self._writer, stage, fn, *args, **kwargs)
+        )
+
+    async def _run(self, executor, stage: str, fn, *args, **kwargs):
+        if executor is None:
+            raise PipelineUnavailableError("The processing pipeline is not running.")
+
+        loop = asyncio.get_running_loop()
+        timeout = self.stage_timeouts.get(stage)
+        start = time.perf_counter()
+
+        try:
+            future = loop.run_in_executor(
+                executor, functools.partial(measured, fn, *args, **kwargs)
+            )
+            # The stage keeps running after a timeout; we only stop waiting for it
+            result, sample = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self._failures.inc(stage=stage)
+            raise StageTimeoutError(stage, timeout)
+        except Exception:
+            self._failures.inc(stage=stage)
+            raise
+
+        self._record(stage, sample, time.perf_counter() - start)
+        return result
+
+    def _record(self, stage: str, sample: dict, elapsed: float):
+        self._durations.observe(sample["duration"], stage=stage)
+        self._waits.observe(max(elapsed - sample["duration"], 0), stage=stage)
+        self._peak_rss.observe(sample["peak_rss"], stage=stage)
+        self._result_bytes.observe(sample["result_bytes"], stage=stage)
+        for step, duration in sample["steps"].items():
+            self._steps.observe(duration, stage=stage, step=step)
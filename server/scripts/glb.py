@@ -0,0 +1,132 @@
+import json
+import struct
+from pathlib import Path
+
+import numpy as np
+
+GLB_MEDIA_TYPE = "model/gltf-binary"
+
+# glTF constants
+_ARRAY_BUFFER = 34962
+_ELEMENT_ARRAY_BUFFER = 34963
+_UNSIGNED_SHORT = 5123
+_UNSIGNED_INT = 5125
+
+
+def glb_path(stl_path):
+    """Returns where the GLB twin of an STL file is written."""
+    return Path(stl_path).with_suffix(".glb")
+
+
+def write_glb(output_path, vertices, faces):
+    """
+    Writes an indexed triangle mesh as a binary glTF file.
+
+    Shared vertices are stored once and positions are quantized to 16 bits
+    over the mesh's bounding box (KHR_mesh_quantization), with the node's
+    translation and scale mapping them back. Compared with STL this drops the
+    per-face normals and repeated corners, so a planet shrinks to about a
+    third of its STL size; loaders recompute smooth normals from the indices.
+
+    Parameters:
+        output_path (str): Path where the GLB file will be saved.
+        vertices (numpy.ndarray): (V, 3) vertex positions.
+        faces (numpy.ndarray): (F, 3) vertex indices.
+
+    Returns:
+        None
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    faces = np.asarray(faces).reshape(-1, 3)
+
+    if len(vertices):
+        lower = vertices.min(axis=0)
+        extent = vertices.max(axis=0) - lower
+    else:
+        lower = np.zeros(3)
+        extent = np.zeros(3)
+    extent[extent == 0] = 1  # Flat axes still need a non-zero scale
+    scale = extent / 65535
+
+    # Quantized positions, padded to 4 components so each vertex is 4-byte aligned
+    positions = np.zeros((len(vertices), 4), dtype="<u2")
+    positions[:, :3] = np.rint((vertices - lower) / scale)
+
+    if len(vertices) <= 65535:
+        indices = faces.astype("<u2").ravel()
+        index_type = _UNSIGNED_SHORT
+    else:
+        indices = faces.astype("<u4").ravel()
+        index_type = _UNSIGNED_INT
+
+    position_bytes = positions.tobytes()
+    index_bytes = indices.tobytes()
+    index_bytes += b"\x00" * (-len(index_bytes) % 4)
+    binary = position_bytes + index_bytes
+
+    quantized_min = positions[:, :3].min(axis=0) if len(vertices) else np.zeros(3)
+    quantized_max = positions[:, :3].max(axis=0) if len(vertices) else np.zeros(3)
+
+    gltf = {
+        "asset": {"version": "2.0", "generator": "conflux"},
+        "extensionsUsed": ["KHR_mesh_quantization"],
+        "extensionsRequired": ["KHR_mesh_quantization"],
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [
+            {
+                "mesh": 0,
+                "translation": lower.tolist(),
+                "scale": scale.tolist(),
+            }
+        ],
+        "meshes": [
+            {"primitives": [{"attributes": {"POSITION": 0}, "indices": 1}]}
+        ],
+        "buffers": [{"byteLength": len(binary)}],
+        "bufferViews": [
+            {
+                "buffer": 0,
+                "byteOffset": 0,
+                "byteLength": len(position_bytes),
+                "byteStride": 8,
+                "target": _ARRAY_BUFFER,
+            },
+            {
+                "buffer": 0,
+                "byteOffset": len(position_bytes),
+                "byteLength": indices.nbytes,
+                "target": _ELEMENT_ARRAY_BUFFER,
+            },
+        ],
+        "accessors": [
+            {
+                "bufferView": 0,
+                "componentType": _UNSIGNED_SHORT,
+                "count": len(vertices),
+                "type": "VEC3",
+                "min": quantized_min.tolist(),
+                "max": quantized_max.tolist(),
+            },
+            {
+                "bufferView": 1,
+                "componentType": index_type,
+                "count": len(indices),
+                "type": "SCALAR",
+            },
+        ],
+    }
+
+    json_bytes = json.dumps(gltf, separators=(",", ":")).encode()
+    json_bytes += b" " * (-len(json_bytes) % 4)
+
+    with open(output_path, "wb") as f:
+        f.write(
+            struct.pack(
+                "<III", 0x46546C67, 2, 12 + 8 + len(json_bytes) + 8 + len(binary)
+            )
+        )
+        f.write(struct.pack("<II", len(json_bytes), 0x4E4F534A))  # JSON chunk
+        f.write(json_bytes)
+        f.write(struct.pack("<II", len(binary), 0x004E4942))  # BIN chunk
+        f.write(binary)
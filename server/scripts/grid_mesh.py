@@ -0,0 +1,71 @@
+import numpy as np
+from stl import mesh
+
+
+def grid_vertices(height_data):
+    """
+    Builds one shared vertex per sample of a heightmap grid.
+
+    Parameters:
+        height_data (numpy.ndarray): 2D array of heights, shape (rows, cols).
+
+    Returns:
+        numpy.ndarray: (rows * cols, 3) array of [x, y, z] vertices, where
+        vertex i * cols + j sits at sample (i, j) and x, y span [0, 1]. Float32
+        heights give float32 vertices, anything else float64.
+    """
+    rows, cols = height_data.shape
+    dtype = np.result_type(height_data.dtype, np.float32)
+    x = np.linspace(0, 1, cols, dtype=dtype)
+    y = np.linspace(0, 1, rows, dtype=dtype)
+    x, y = np.meshgrid(x, y)
+
+    return np.column_stack((x.ravel(), y.ravel(), height_data.ravel()))
+
+
+def grid_faces(rows, cols):
+    """
+    Triangulates a rows x cols grid of shared vertices.
+
+    Each cell (i, j) yields the triangles (v0, v1, v2) and (v2, v1, v3), where
+    v0 = (i, j), v1 = (i + 1, j), v2 = (i, j + 1) and v3 = (i + 1, j + 1).
+    Cells are emitted row by row, matching the order of the original nested
+    loop so that STL output stays byte-identical.
+
+    Parameters:
+        rows (int): Number of grid rows.
+        cols (int): Number of grid columns.
+
+    Returns:
+        numpy.ndarray: (2 * (rows - 1) * (cols - 1), 3) array of vertex indices.
+    """
+    i, j = np.meshgrid(np.arange(rows - 1), np.arange(cols - 1), indexing="ij")
+    v0 = (i * cols + j).ravel()
+    v1 = v0 + cols
+    v2 = v0 + 1
+    v3 = v1 + 1
+
+    faces = np.empty((v0.size, 2, 3), dtype=np.int64)
+    faces[:, 0] = np.column_stack((v0, v1, v2))
+    faces[:, 1] = np.column_stack((v2, v1, v3))
+
+    return faces.reshape(-1, 3)
+
+
+def heightmap_to_stl_mesh(height_data):
+    """
+    Converts a heightmap into a numpy-stl mesh in a single vectorized pass.
+
+    Parameters:
+        height_data (numpy.ndarray): 2D array of heights, shape (rows, cols).
+
+    Returns:
+        stl.mesh.Mesh: The triangulated terrain.
+    """
+    vertices = grid_vertices(height_data)
+    faces = grid_faces(*height_data.shape)
+
+    terrain_mesh = mesh.Mesh(np.zeros(faces.shape[0], dtype=mesh.Mesh.dtype))
+    terrain_mesh.vectors[:] = vertices[faces]
+
+    return terrain_mesh
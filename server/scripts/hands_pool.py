@@ -0,0 +1,82 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+import mediapipe as mp
+import numpy as np
+
+
+class HandsPool:
+    """
+    A fixed-size pool of warmed-up Mediapipe Hands detectors.
+
+    Building a Hands model loads its graph from disk, which costs far more
+    than running it on one image, so detectors are created once and then
+    checked out and returned around each call to `process`.
+    """
+
+    def __init__(self, size: int, threshold: float = 0.7):
+        self.size = size
+        self.threshold = threshold
+        self._idle = queue.Queue()
+        self._detectors = []
+
+        for _ in range(size):
+            hands = mp.solutions.hands.Hands(
+                static_image_mode=True,
+                max_num_hands=1,
+                min_detection_confidence=threshold,
+            )
+            # Run one blank frame so lazy graph initialization happens now
+            hands.process(np.zeros((64, 64, 3), dtype=np.uint8))
+            self._detectors.append(hands)
+            self._idle.put(hands)
+
+    @contextmanager
+    def checkout(self, timeout: float = None):
+        """Borrows a detector, blocking until one is free, and returns it after use."""
+        try:
+            hands = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No hand detector became available in time.")
+
+        try:
+            yield hands
+        finally:
+            self._idle.put(hands)
+
+    def close(self):
+        for hands in self._detectors:
+            hands.close()
+        self._detectors = []
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def init_hands_pool(size: int = None, threshold: float = 0.7) -> HandsPool:
+    """
+    Creates the process-wide detector pool, sized to the machine's cores by default.
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = HandsPool(size or os.cpu_count() or 1, threshold)
+        return _pool
+
+
+def get_hands_pool() -> HandsPool:
+    """Returns the process-wide pool, or None if it has not been created."""
+    return _pool
+
+
+def close_hands_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
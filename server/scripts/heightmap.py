@@ -0,0 +1,124 @@
+from functools import lru_cache
+
+import cv2
+import numpy as np
+from PIL import Image
+from scipy.ndimage import gaussian_filter
+
+from scripts.metrics import step
+
+BLUR_BACKENDS = ("scipy", "opencv")
+
+
+def load_heightmap(height_map_image, size=(300, 300)) -> np.ndarray:
+    """
+    Reads a grayscale heightmap as float32 heights between 0 and 1.
+
+    Parameters:
+        height_map_image (PIL.Image.Image | numpy.ndarray): The grayscale heightmap.
+        size (tuple): (width, height) to resize it to.
+
+    Returns:
+        numpy.ndarray: (height, width) float32 array.
+    """
+    if isinstance(height_map_image, np.ndarray):
+        height_map_image = Image.fromarray(height_map_image)
+    height_map_image = height_map_image.convert("L")
+
+    # Resize for manageability (optional, depends on input image size)
+    height_map_image = height_map_image.resize(size)
+
+    return np.asarray(height_map_image, dtype=np.float32) / np.float32(255)
+
+
+def blur(height_data, sigma, backend="scipy") -> np.ndarray:
+    """
+    Gaussian smoothing with reflected borders, in float32.
+
+    Both backends use the same kernel: SciPy's default truncation at 4 sigma,
+    which OpenCV gets as an explicit kernel size.
+    """
+    height_data = np.asarray(height_data, dtype=np.float32)
+    if backend == "scipy":
+        return gaussian_filter(height_data, sigma=sigma)
+    if backend == "opencv":
+        ksize = 2 * int(4 * sigma + 0.5) + 1
+        return cv2.GaussianBlur(
+            height_data,
+            (ksize, ksize),
+            sigmaX=sigma,
+            sigmaY=sigma,
+            borderType=cv2.BORDER_REFLECT,
+        )
+    raise ValueError(f"Unknown blur backend {backend!r}, expected {BLUR_BACKENDS}.")
+
+
+@lru_cache(maxsize=8)
+def edge_weights(shape, margin) -> np.ndarray:
+    """
+    Weight of each sample's own height against the edge value.
+
+    The weight falls linearly from 1, `margin` samples in from an edge, to 0
+    on the edge. Fading rows and then columns multiplies their weights, so
+    the mask is the outer product of the row and column falloffs.
+
+    Returns:
+        numpy.ndarray: Read-only float32 array of the given shape.
+    """
+    rows, cols = shape
+    if margin <= 0:
+        weights = np.ones(shape, dtype=np.float32)
+    else:
+        i = np.arange(rows)
+        j = np.arange(cols)
+        row_weights = np.minimum(np.minimum(i, rows - 1 - i) / margin, 1)
+        col_weights = np.minimum(np.minimum(j, cols - 1 - j) / margin, 1)
+        weights = (row_weights[:, None] * col_weights[None, :]).astype(np.float32)
+
+    weights.flags.writeable = False
+    return weights
+
+
+def blend_edges(height_data, margin) -> np.ndarray:
+    """
+    Smoothly brings the edges of a heightmap to the average height within the
+    margin, so neighbouring tiles meet at similar heights.
+    """
+    if margin <= 0:
+        return height_data
+
+    # Calculate the average value within the margin
+    edge_value = (
+        np.mean(height_data[:margin, :])
+        + np.mean(height_data[-margin:, :])
+        + np.mean(height_data[:, :margin])
+        + np.mean(height_data[:, -margin:])
+    ) / 4
+
+    weights = edge_weights(height_data.shape, margin)
+    return edge_value + weights * (height_data - edge_value)
+
+
+def preprocess_heightmap(
+    height_map_image, sigma=5, margin=20, size=(300, 300), backend="scipy"
+):
+    """
+    Turns a grayscale image into the smoothed heights a landscape is built on.
+
+    Parameters:
+        height_map_image (PIL.Image.Image | numpy.ndarray): The grayscale heightmap.
+        sigma (float): The Gaussian smoothing parameter.
+        margin (int): The margin (in pixels) from the edge where smoothing starts.
+        size (tuple): (width, height) of the heightmap.
+        backend (str): Blur implementation, "scipy" or "opencv".
+
+    Returns:
+        numpy.ndarray: (height, width) float32 heights.
+    """
+    height_data = load_heightmap(height_map_image, size)
+
+    # Apply Gaussian smoothing
+    with step("filter"):
+        height_data = blur(height_data, sigma, backend)
+
+    return blend_edges(height_data, margin)
@@ -0,0 +1,101 @@
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+# Pipeline stages in the order they complete
+STAGES = ("palm", "landscape", "planet", "collective")
+
+STAGE_MESSAGES = {
+    "palm": "Palm extracted",
+    "landscape": "Landscape built",
+    "planet": "Planet built",
+    "collective": "Collective planet built",
+}
+
+
+class Job:
+    """Progress of one upload through the palm -> planet pipeline."""
+
+    def __init__(self, name: str, client_ip: str):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.client_ip = client_ip
+        self.status = "queued"  # queued -> running -> done | failed
+        self.stages = {stage: "pending" for stage in STAGES}
+        self.artifacts = {}
+        self.error = None
+        self.cached = False  # Reused the results of an identical earlier upload
+        self.created_at = datetime.utcnow().isoformat()
+        self.updated_at = self.created_at
+
+    def start(self):
+        self.status = "running"
+        self._touch()
+
+    def complete_stage(self, stage: str, **artifacts):
+        self.stages[stage] = "done"
+        self.artifacts.update({key: str(path) for key, path in artifacts.items()})
+        self._touch()
+
+    def finish(self):
+        self.status = "done"
+        self._touch()
+
+    def fail(self, error: str):
+        self.status = "failed"
+        self.error = error
+        for stage, state in self.stages.items():
+            if state == "pending":
+                self.stages[stage] = "skipped"
+        self._touch()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def _touch(self):
+        self.updated_at = datetime.utcnow().isoformat()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "stages": dict(self.stages),
+            "artifacts": dict(self.artifacts),
+            "error": self.error,
+            "cached": self.cached,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class JobRegistry:
+    """
+    Keeps recent jobs in memory, forgetting the oldest finished ones once
+    more than `max_jobs` are held.
+    """
+
+    def __init__(self, max_jobs: int = 1000):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+
+    def create(self, name: str, client_ip: str) -> Job:
+        job = Job(name, client_ip)
+        self._jobs[job.id] = job
+        self._prune()
+        return job
+
+    def get(self, job_id: str) -> Job:
+        return self._jobs.get(job_id)
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def _prune(self):
+        if len(self._jobs) <= self.max_jobs:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished]:
+            del self._jobs[job_id]
+            if len(self._jobs) <= self.max_jobs:
+                break
@@ -1,94 +1,108 @@
 import numpy as np
 from PIL import Image
-from scipy.ndimage import gaussian_filter
-from stl import mesh
+from scipy.ndimage import map_coordinates
 
+from scripts.glb import glb_path, write_glb
+from scripts.grid_mesh import grid_faces, grid_vertices
+from scripts.heightmap import preprocess_heightmap
+from scripts.metrics import step
+from scripts.rtin import rtin_faces
+from scripts.stl_io import write_stl
+from scripts.tile_mesh import indexed_path, save_indexed_mesh
 
-def generate_3d_mesh_from_heightmap(
-    input_image_path, output_stl_path, sigma=5, margin=20
-):
+# Samples per side of the heightmap triangulated adaptively (RTIN needs 2^k + 1)
+RTIN_GRID_SIZE = 257
+
+
+def landscape_mesh(height_map_image, sigma=5, margin=20, max_error=None, blur="scipy"):
     """
-    Generates a 3D mesh from a grayscale heightmap image.
+    Builds the landscape mesh of a grayscale heightmap.
+
+    By default the smoothed 300x300 heightmap is triangulated uniformly, with
+    two triangles per cell. With `max_error`, it is resampled to a 257x257
+    grid and triangulated adaptively (see `scripts.rtin`): flat areas get
+    large triangles, and no sample of that grid is further than `max_error`
+    from the surface (heights span 0 to 1).
 
     Parameters:
-        input_image_path (str): Path to the grayscale PNG image.
-        output_stl_path (str): Path where the STL file will be saved.
+        height_map_image (PIL.Image.Image | numpy.ndarray): The grayscale heightmap.
         sigma (float): The Gaussian smoothing parameter.
         margin (int): The margin (in pixels) from the edge where smoothing starts.
+        max_error (float): Vertical error allowed by the adaptive triangulation,
+            or None to triangulate every cell.
+        blur (str): Gaussian blur implementation, "scipy" or "opencv".
 
     Returns:
-        None
+        tuple: (vertices, faces), one vertex per grid sample used.
     """
-    # Load the grayscale image
-    height_map_image = Image.open(input_image_path).convert("L")
+    smoothed_height_data = preprocess_heightmap(
+        height_map_image, sigma, margin, backend=blur
+    )
+    rows, cols = smoothed_height_data.shape
 
-    # Resize for manageability (optional, depends on input image size)
-    height_map_image = height_map_image.resize((300, 300))
+    if max_error:
+        with step("mesh"):
+            return adaptive_mesh(smoothed_height_data, max_error)
 
-    # Convert to numpy array and normalize
-    height_data = np.array(height_map_image) / 255.0
+    # One vertex per grid sample, shared by the STL and its indexed twins
+    with step("mesh"):
+        vertices = grid_vertices(smoothed_height_data)
+        faces = grid_faces(rows, cols)
 
-    # Apply Gaussian smoothing
-    smoothed_height_data = gaussian_filter(height_data, sigma=sigma)
+    return vertices, faces
 
-    # Calculate the average value within the margin
-    top_margin_avg = np.mean(smoothed_height_data[:margin, :])
-    bottom_margin_avg = np.mean(smoothed_height_data[-margin:, :])
-    left_margin_avg = np.mean(smoothed_height_data[:, :margin])
-    right_margin_avg = np.mean(smoothed_height_data[:, -margin:])
 
-    edge_value = (
-        top_margin_avg + bottom_margin_avg + left_margin_avg + right_margin_avg
-    ) / 4
+def adaptive_mesh(height_data, max_error, size=RTIN_GRID_SIZE):
+    """
+    Triangulates a heightmap adaptively on a size x size grid spanning it.
+
+    Returns:
+        tuple: (vertices, faces), keeping only the samples the faces use.
+    """
+    # Bilinear resampling that keeps the corners, so the tile spans [0, 1] as before
+    rows, cols = height_data.shape
+    y, x = np.meshgrid(
+        np.linspace(0, rows - 1, size), np.linspace(0, cols - 1, size), indexing="ij"
+    )
+    height_data = map_coordinates(height_data, [y, x], order=1)
+
+    faces = rtin_faces(height_data, max_error)
+    used, faces = np.unique(faces, return_inverse=True)
+
+    return grid_vertices(height_data)[used], faces.reshape(-1, 3)
 
-    # Smoothly bring the edges of the height map to the average value within the margin
-    rows, cols = smoothed_height_data.shape
-    for i in range(rows):
-        if i < margin or i >= rows - margin:
-            factor = min(i / margin, (rows - 1 - i) / margin, 1)
-            smoothed_height_data[i, :] = (
-                1 - factor
-            ) * edge_value + factor * smoothed_height_data[i, :]
-
-    for j in range(cols):
-        if j < margin or j >= cols - margin:
-            factor = min(j / margin, (cols - 1 - j) / margin, 1)
-            smoothed_height_data[:, j] = (
-                1 - factor
-            ) * edge_value + factor * smoothed_height_data[:, j]
-
-    # Create a grid for the mesh
-    x = np.linspace(0, 1, smoothed_height_data.shape[1])
-    y = np.linspace(0, 1, smoothed_height_data.shape[0])
-    x, y = np.meshgrid(x, y)
-
-    # Prepare vertices and faces for STL
-    vertices = []
-    faces = []
-    for i in range(x.shape[0] - 1):
-        for j in range(y.shape[1] - 1):
-            # Define the vertices of two triangles for each grid cell
-            v0 = [x[i, j], y[i, j], smoothed_height_data[i, j]]
-            v1 = [x[i + 1, j], y[i + 1, j], smoothed_height_data[i + 1, j]]
-            v2 = [x[i, j + 1], y[i, j + 1], smoothed_height_data[i, j + 1]]
-            v3 = [x[i + 1, j + 1], y[i + 1, j + 1], smoothed_height_data[i + 1, j + 1]]
-
-            # Append vertices for the two triangles
-            vertices.extend([v0, v1, v2, v3])
-
-            # Triangle 1 (v0, v1, v2)
-            faces.append([len(vertices) - 4, len(vertices) - 3, len(vertices) - 2])
-            # Triangle 2 (v2, v1, v3)
-            faces.append([len(vertices) - 2, len(vertices) - 3, len(vertices) - 1])
-
-    vertices = np.array(vertices)
-    faces = np.array(faces)
-
-    # Create the mesh
-    terrain_mesh = mesh.Mesh(np.zeros(faces.shape[0], dtype=mesh.Mesh.dtype))
-    for i, f in enumerate(faces):
-        for j in range(3):
-            terrain_mesh.vectors[i][j] = vertices[f[j], :]
 
+def save_landscape(output_stl_path, vertices, faces):
+    """Writes a landscape mesh as STL, plus its indexed .npz and GLB twins."""
     # Save the mesh to an STL file
-    terrain_mesh.save(output_stl_path)
+    write_stl(output_stl_path, vertices, faces, header=b"conflux landscape")
+
+    # And the indexed twins, for the planet builders and the web clients
+    save_indexed_mesh(indexed_path(output_stl_path), vertices, faces)
+    write_glb(glb_path(output_stl_path), vertices, faces)
+
+
+def generate_3d_mesh_from_heightmap(
+    input_image_path, output_stl_path, sigma=5, margin=20, max_error=None, blur="scipy"
+):
+    """
+    Generates a 3D mesh from a grayscale heightmap image.
+
+    Parameters:
+        input_image_path (str): Path to the grayscale PNG image.
+        output_stl_path (str): Path where the STL file will be saved.
+        sigma (float): The Gaussian smoothing parameter.
+        margin (int): The margin (in pixels) from the edge where smoothing starts.
+        max_error (float): Vertical error allowed by the adaptive triangulation,
+            or None to triangulate every cell.
+        blur (str): Gaussian blur implementation, "scipy" or "opencv".
+
+    Returns:
+        None
+    """
+    # Load the grayscale image
+    with Image.open(input_image_path) as height_map_image:
+        vertices, faces = landscape_mesh(
+            height_map_image, sigma, margin, max_error, blur
+        )
+    save_landscape(output_stl_path, vertices, faces)
@@ -0,0 +1,89 @@
+import re
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from scripts.grid_mesh import grid_faces
+from scripts.sphere_projection import grid_index
+
+# Levels of detail: level n keeps every (2 ** n)th grid sample per axis, so
+# about 1 / 4 ** n of the triangles. Level 0 is the full mesh.
+LOD_LEVELS = (0, 1, 2)
+
+_LOD_STEM = re.compile(r"_lod\d+$")
+
+
+def lod_path(path, lod: int) -> Path:
+    """Returns where a level of detail of a mesh file is written (itself for 0)."""
+    path = Path(path)
+    if lod == 0:
+        return path
+    return path.with_name(f"{path.stem}_lod{lod}{path.suffix}")
+
+
+def is_lod_path(path) -> bool:
+    """Whether a file is a reduced level of detail rather than a full mesh."""
+    return _LOD_STEM.search(Path(path).stem) is not None
+
+
+def lod_samples(n: int, lod: int) -> np.ndarray:
+    """Indices of the grid lines kept along an axis of n samples, ends included."""
+    samples = np.arange(0, n, 2**lod)
+    if samples[-1] != n - 1:
+        samples = np.append(samples, n - 1)  # Keep the tile edge so seams still meet
+    return samples
+
+
+@lru_cache(maxsize=16)
+def _lod_grid(shape, lod):
+    rows, cols = shape
+    row_samples = lod_samples(rows, lod)
+    col_samples = lod_samples(cols, lod)
+
+    samples = (row_samples[:, None] * cols + col_samples[None, :]).ravel()
+    faces = grid_faces(len(row_samples), len(col_samples)).astype(np.int32)
+    samples.flags.writeable = False
+    faces.flags.writeable = False
+    return samples, faces
+
+
+def grid_lods(vertices, levels=LOD_LEVELS[1:]):
+    """
+    Decimates a tile laid out on the regular landscape grid.
+
+    Every level keeps a subset of the grid lines, always including the tile's
+    edges, and triangulates them as a coarser grid. Since the tile is only
+    subsampled, this works as well on vertices already projected onto the
+    sphere, as long as they are in the tile's vertex order.
+
+    Parameters:
+        vertices (numpy.ndarray): (V, 3) flat tile vertices, in any order.
+        levels (tuple): The levels of detail to build.
+
+    Returns:
+        dict: {level: (vertex_ids, faces)}, the vertices each level keeps and
+        its faces indexing into them, or None if the tile is not a full grid.
+    """
+    index = grid_index(np.asarray(vertices))
+    if index is None:
+        return None
+
+    shape, flat_index = index
+    samples = shape[0] * shape[1]
+    if flat_index is None:
+        order = None
+    else:
+        if len(flat_index) != samples:
+            return None
+        # order[s] is the vertex sitting on grid sample s
+        order = np.full(samples, -1, dtype=np.intp)
+        order[flat_index] = np.arange(len(flat_index))
+        if (order < 0).any():
+            return None
+
+    lods = {}
+    for lod in levels:
+        kept, faces = _lod_grid(shape, lod)
+        lods[lod] = (kept if order is None else order[kept], faces)
+    return lods
@@ -0,0 +1,222 @@
+import bisect
+import json
+import sqlite3
+import threading
+from pathlib import Path
+
+
+class MetadataStore:
+    """
+    Visitor metadata backed by SQLite, with an in-memory index.
+
+    Every visitor entry (the same dict that used to live in scheme.json) is
+    kept in memory by client IP and in timestamp order, so lookups never touch
+    the disk. Each write is a single-row transaction, so concurrent uploads
+    can no longer overwrite each other's changes and the cost of a write does
+    not grow with the number of visitors.
+    """
+
+    def __init__(self, database_path: Path):
+        self.database_path = Path(database_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.database_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS visitors (
+                    client_ip TEXT PRIMARY KEY,
+                    timestamp TEXT NOT NULL,
+                    entry TEXT NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS visitors_timestamp ON visitors (timestamp)"
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS planet_tiles (
+                    tile_index INTEGER PRIMARY KEY,
+                    path TEXT NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS planet_settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+                """
+            )
+
+        self._by_ip = {}
+        self._by_time = []  # Sorted (timestamp, client_ip) pairs
+        self._index_all(
+            (client_ip, json.loads(entry))
+            for client_ip, entry in self._conn.execute(
+                "SELECT client_ip, entry FROM visitors"
+            )
+        )
+
+    def __len__(self):
+        return len(self._by_ip)
+
+    def __contains__(self, client_ip: str):
+        return client_ip in self._by_ip
+
+    def get(self, client_ip: str) -> dict:
+        """Returns the visitor's entry, or None."""
+        return self._by_ip.get(client_ip)
+
+    def latest(self, count: int = 1) -> list:
+        """Returns the `count` most recent entries, newest first."""
+        return [
+            self._by_ip[client_ip]
+            for _, client_ip in reversed(self._by_time[-count:])
+        ]
+
+    def since(self, timestamp: str) -> list:
+        """Returns the entries written at or after `timestamp`, oldest first."""
+        start = bisect.bisect_left(self._by_time, (timestamp, ""))
+        return [self._by_ip[client_ip] for _, client_ip in self._by_time[start:]]
+
+    def put(self, client_ip: str, entry: dict):
+        """Adds or replaces a visitor's entry."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO visitors (client_ip, timestamp, entry) VALUES (?, ?, ?)",
+                    (client_ip, entry["timestamp"], json.dumps(entry)),
+                )
+            self._index(client_ip, entry)
+
+    def _index(self, client_ip: str, entry: dict):
+        previous = self._by_ip.get(client_ip)
+        if previous is not None:
+            key = (previous["timestamp"], client_ip)
+            position = bisect.bisect_left(self._by_time, key)
+            if position < len(self._by_time) and self._by_time[position] == key:
+                del self._by_time[position]
+
+        self._by_ip[client_ip] = entry
+        key = (entry["timestamp"], client_ip)
+        if not self._by_time or key >= self._by_time[-1]:
+            self._by_time.append(key)  # New uploads are the newest entry
+        else:
+            bisect.insort(self._by_time, key)
+
+    def _index_all(self, entries):
+        # Sorts once rather than inserting entry by entry
+        self._by_ip.update(entries)
+        self._by_time = sorted(
+            (entry["timestamp"], client_ip) for client_ip, entry in self._by_ip.items()
+        )
+
+    def planet_tiles(self) -> dict:
+        """Returns the planet.json-style {tile_index: {"path": ...}} mapping."""
+        return {
+            str(tile_index): {"path": path}
+            for tile_index, path in self._conn.execute(
+                "SELECT tile_index, path FROM planet_tiles ORDER BY tile_index"
+            )
+        }
+
+    def planet_setting(self, key: str, default=None):
+        row = self._conn.execute(
+            "SELECT value FROM planet_settings WHERE key = ?", (key,)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    @staticmethod
+    def _read_dict(path: Path) -> dict:
+        with open(path, "r") as f:
+            data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError(f"{Path(path).name} is not a dictionary!")
+        return data
+
+    def _insert_scheme(self, data: dict):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO visitors (client_ip, timestamp, entry) VALUES (?, ?, ?)",
+            (
+                (client_ip, entry["timestamp"], json.dumps(entry))
+                for client_ip, entry in data.items()
+            ),
+        )
+
+    def _insert_planet(self, config: dict):
+        tiles = config.get("tiles", {})
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO planet_tiles (tile_index, path) VALUES (?, ?)",
+            ((int(index), tile["path"]) for index, tile in tiles.items()),
+        )
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO planet_settings (key, value) VALUES (?, ?)",
+            (
+                (key, json.dumps(value))
+                for key, value in config.items()
+                if key != "tiles"
+            ),
+        )
+
+    def import_scheme(self, scheme_path: Path) -> int:
+        """Bulk-imports the visitor entries of a legacy scheme.json in one transaction."""
+        data = self._read_dict(scheme_path)
+        with self._lock:
+            with self._conn:
+                self._insert_scheme(data)
+            self._index_all(data.items())
+
+        return len(data)
+
+    def import_planet(self, planet_path: Path) -> int:
+        """Bulk-imports the tile layout of a legacy planet.json in one transaction."""
+        config = self._read_dict(planet_path)
+        with self._lock:
+            with self._conn:
+                self._insert_planet(config)
+
+        return len(config.get("tiles", {}))
+
+    def import_legacy(self, scheme_path: Path, planet_path: Path) -> bool:
+        """
+        Imports the legacy scheme.json and planet.json (where they exist) once.
+
+        Both files are imported in one transaction that also records the
+        import in planet_settings["legacy_imported"], so a failed import
+        leaves nothing behind and is retried on the next start.
+
+        Returns:
+            bool: Whether the files were imported now (False if done before).
+        """
+        if self.planet_setting("legacy_imported", False):
+            return False
+
+        scheme_path, planet_path = Path(scheme_path), Path(planet_path)
+        data = self._read_dict(scheme_path) if scheme_path.exists() else {}
+        config = self._read_dict(planet_path) if planet_path.exists() else {}
+        with self._lock:
+            with self._conn:
+                self._insert_scheme(data)
+                self._insert_planet(config)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO planet_settings (key, value) VALUES (?, ?)",
+                    ("legacy_imported", json.dumps(True)),
+                )
+            self._index_all(data.items())
+
+        return True
+
+    def close(self):
+        self._conn.close()
+
+
+if __name__ == "__main__":
+    store = MetadataStore(Path("data") / "conflux.db")
+    print(f"Imported {store.import_scheme(Path('data') / 'scheme.json')} visitors")
+    print(f"Imported {store.import_planet(Path('data') / 'planet.json')} planet tiles")
+    store.close()
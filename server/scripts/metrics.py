@@ -0,0 +1,199 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Histogram bucket upper bounds
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = tuple(n * 2**20 for n in (1, 4, 16, 64, 256, 1024, 4096))
+
+# Steps timed by `step` while `measured` runs a stage on this thread
+_current = threading.local()
+
+
+@contextmanager
+def step(name: str):
+    """Times one part of a stage, reported along with the stage by `measured`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        steps = getattr(_current, "steps", None)
+        if steps is not None:
+            steps[name] = steps.get(name, 0) + time.perf_counter() - start
+
+
+def peak_rss() -> int:
+    """Peak resident memory of this process so far, in bytes."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # KiB on Linux
+
+
+def result_bytes(result) -> int:
+    """Total size of the arrays in a stage's result."""
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    if isinstance(result, (tuple, list)):
+        return sum(result_bytes(item) for item in result)
+    return 0
+
+
+def measured(fn, *args, **kwargs):
+    """
+    Runs a stage and returns (result, sample).
+
+    The sample is measured where the stage runs (usually a worker process)
+    and holds its wall time, the process's peak RSS afterwards, the size of
+    the arrays it returned and the time spent in each of its `step`s.
+    """
+    _current.steps = {}
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+        sample = {
+            "duration": time.perf_counter() - start,
+            "peak_rss": peak_rss(),
+            "result_bytes": result_bytes(result),
+            "steps": _current.steps,
+        }
+    finally:
+        _current.steps = None
+    return result, sample
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels, **extra) -> str:
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Counts observations into cumulative buckets, per set of label values."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}  # labels -> [bucket counts, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * len(self.buckets), 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._series[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            series = {
+                key: (list(counts), total)
+                for key, (counts, total) in self._series.items()
+            }
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = _format_value(bound)
+                yield "_bucket", _format_labels(labels, le=le), cumulative
+            yield "_sum", _format_labels(labels), total
+            yield "_count", _format_labels(labels), cumulative
+
+
+class Counter:
+    """A count that only goes up, per set of label values."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            series = dict(self._series)
+        for labels, value in sorted(series.items()):
+            yield "", _format_labels(labels), value
+
+
+class Callback:
+    """A gauge (or counter kept elsewhere) read from a function at scrape time."""
+
+    def __init__(self, name: str, help: str, fn, kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.kind = kind
+
+    def samples(self):
+        yield "", "", self.fn()
+
+
+class MetricsRegistry:
+    """
+    Metrics rendered in the Prometheus text exposition format.
+
+    Histograms and counters are updated as the pipeline runs; callbacks read
+    live values such as the queue depth when the metrics are scraped.
+    """
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name: str, help: str, buckets=DURATION_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, buckets))
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._register(Counter(name, help))
+
+    def callback(self, name: str, help: str, fn, kind: str = "gauge") -> Callback:
+        return self._register(Callback(name, help, fn, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,91 @@
+import asyncio
+import json
+from collections import deque
+
+
+class Subscriber:
+    """One connected event stream with its own bounded queue."""
+
+    def __init__(self, queue_size: int):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def push(self, event):
+        # A slow screen loses its oldest events rather than growing without bound
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+
+class NotificationHub:
+    """
+    Broadcasts server-sent events to every connected screen.
+
+    Each subscriber gets its own bounded queue (dropping the oldest event when
+    full), and the last `history_size` events are kept so a reconnecting
+    client can catch up from its `Last-Event-ID`.
+    """
+
+    def __init__(
+        self, queue_size: int = 32, history_size: int = 64, keepalive: float = 15.0
+    ):
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+        self.history = deque(maxlen=history_size)
+        self.subscribers = set()
+        self.last_event_id = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self.subscribers)
+
+    def publish(self, data: dict) -> int:
+        """Sends an event to every subscriber and returns its ID."""
+        self.last_event_id += 1
+        event = (self.last_event_id, data)
+        self.history.append(event)
+
+        for subscriber in self.subscribers:
+            subscriber.push(event)
+
+        return self.last_event_id
+
+    def subscribe(self, last_event_id: str = None) -> Subscriber:
+        subscriber = Subscriber(self.queue_size)
+
+        # Replay what the client missed, unless its ID predates a server restart
+        if last_event_id is not None:
+            try:
+                seen = int(last_event_id)
+            except ValueError:
+                seen = None
+            if seen is not None and seen <= self.last_event_id:
+                for event in self.history:
+                    if event[0] > seen:
+                        subscriber.push(event)
+
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def stream(self, last_event_id: str = None):
+        """Yields SSE-formatted events, with keepalive comments while idle."""
+        subscriber = self.subscribe(last_event_id)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event_id, data = await asyncio.wait_for(
+                        subscriber.queue.get(), self.keepalive
+                    )
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+
+                yield f"id: {event_id}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            # Runs when the client disconnects and the response is cancelled
+            self.unsubscribe(subscriber)
@@ -1,6 +1,11 @@
 import cv2
 import mediapipe as mp
+import numpy as np
 from pathlib import Path
+from PIL import Image
+
+from scripts.hands_pool import get_hands_pool
+from scripts.metrics import step
 
 
 # Function to capitalize first letter of name and convert to CamelCase
@@ -9,82 +14,73 @@ def to_camel_case_with_capital(name: str) -> str:
     return "".join(word.capitalize() for word in words)
 
 
-def extract_palm_region(
-    image_path: Path,
-    output_normal_path: Path,
-    output_greyscale_path: Path,
-    size: int,
-    threshold: float = 0.7,
-):
-    # Load the image
-    image = cv2.imread(str(image_path))
-    if image is None:
-        raise ValueError("Could not read the image file.")
+# Decode flags for each reduction factor; JPEGs are decoded at that scale directly
+REDUCED_COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
 
-    # Initialize Mediapipe Hands
-    mp_hands = mp.solutions.hands
-    mp_drawing = mp.solutions.drawing_utils
-    hands = mp_hands.Hands(
-        static_image_mode=True, max_num_hands=1, min_detection_confidence=threshold
-    )
+# zlib level for the palm PNGs: level 9 takes about 4x longer for ~5% smaller files
+PNG_COMPRESSION = 3
 
-    # Convert the image to RGB for Mediapipe
-    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGRA2RGB)
-    result = hands.process(image_rgb)
+# Typical side of the palm crop relative to the photo's short side
+PALM_CROP_FRACTION = 0.25
 
-    if not result.multi_hand_landmarks:
-        raise ValueError(
-            "No hand detected in the image. Please upload a better quality image of your hand."
-        )
 
-    # Perform a weighted average of the landmarks to find the center of the hand
+def coarsest_reduction(side: int, size: int) -> int:
+    """Largest reduction factor that keeps `side` pixels at `size` or more."""
+    reduction = 1
+    while reduction < 8 and side // (reduction * 2) >= size:
+        reduction *= 2
+    return reduction
 
-    LANDMARKS_OF_INTEREST = {
-        mp_hands.HandLandmark.WRIST: 1,
-        mp_hands.HandLandmark.THUMB_MCP: 1,
-        mp_hands.HandLandmark.INDEX_FINGER_MCP: 1,
-        mp_hands.HandLandmark.MIDDLE_FINGER_MCP: 1,
-        mp_hands.HandLandmark.PINKY_MCP: 1,
-    }
-    # print(result.multi_hand_landmarks)
 
-    for hand_landmarks in result.multi_hand_landmarks:
-        h, w, _ = image.shape
-        # print(hand_landmarks.landmark[mp_hands.HandLandmark.WRIST].x)
-        # Calculate the geometric center of all landmarks
-        center_x = int(
-            sum(
-                hand_landmarks.landmark[landmark].x * w * weight
-                for landmark, weight in LANDMARKS_OF_INTEREST.items()
-            )
-            / sum(weight for weight in LANDMARKS_OF_INTEREST.values())
-        )
+def decode_image(data: np.ndarray, reduction: int = 1):
+    with step("decode"):
+        image = cv2.imdecode(data, REDUCED_COLOR_FLAGS[reduction])
+    if image is None:
+        raise ValueError("Could not read the image file.")
+    return image
 
-        center_y = int(
-            sum(
-                hand_landmarks.landmark[landmark].y * h * weight
-                for landmark, weight in LANDMARKS_OF_INTEREST.items()
-            )
-            / sum(weight for weight in LANDMARKS_OF_INTEREST.values())
-        )
 
-        # Find the bounding box based on the landmarks of interest
-        x_min = min(
-            int(hand_landmarks.landmark[landmark].x * w)
-            for landmark in LANDMARKS_OF_INTEREST.keys()
+def palm_crop_box(hand_landmarks, landmarks_of_interest, w: int, h: int):
+    """Returns the (x_start, y_start, x_end, y_end) palm square in a w x h image."""
+    # Calculate the geometric center of all landmarks
+    center_x = int(
+        sum(
+            hand_landmarks.landmark[landmark].x * w * weight
+            for landmark, weight in landmarks_of_interest.items()
         )
-        x_max = max(
-            int(hand_landmarks.landmark[landmark].x * w)
-            for landmark in LANDMARKS_OF_INTEREST.keys()
-        )
-        y_min = min(
-            int(hand_landmarks.landmark[landmark].y * h)
-            for landmark in LANDMARKS_OF_INTEREST.keys()
-        )
-        y_max = max(
-            int(hand_landmarks.landmark[landmark].y * h)
-            for landmark in LANDMARKS_OF_INTEREST.keys()
+        / sum(weight for weight in landmarks_of_interest.values())
+    )
+
+    center_y = int(
+        sum(
+            hand_landmarks.landmark[landmark].y * h * weight
+            for landmark, weight in landmarks_of_interest.items()
         )
+        / sum(weight for weight in landmarks_of_interest.values())
+    )
+
+    # Find the bounding box based on the landmarks of interest
+    x_min = min(
+        int(hand_landmarks.landmark[landmark].x * w)
+        for landmark in landmarks_of_interest.keys()
+    )
+    x_max = max(
+        int(hand_landmarks.landmark[landmark].x * w)
+        for landmark in landmarks_of_interest.keys()
+    )
+    y_min = min(
+        int(hand_landmarks.landmark[landmark].y * h)
+        for landmark in landmarks_of_interest.keys()
+    )
+    y_max = max(
+        int(hand_landmarks.landmark[landmark].y * h)
+        for landmark in landmarks_of_interest.keys()
+    )
 
     # print(f"Center: ({center_x}, {center_y})")
     # print(f"Bounding Box: ({x_min}, {y_min}) to ({x_max}, {y_max})")
@@ -107,27 +103,127 @@ def extract_palm_region(
     x_end = min(w, center_x + crop_size // 2)
     y_end = min(h, center_y + crop_size // 2)
 
+    return x_start, y_start, x_end, y_end
+
+
+def crop_palm(image_path: Path, size: int, threshold: float = 0.7):
+    """
+    Detects the hand in a photo and cuts out its palm.
+
+    Parameters:
+        image_path (Path): Path to the uploaded photo.
+        size (int): Side in pixels of the square palm image.
+        threshold (float): Minimum hand detection confidence.
+
+    Returns:
+        tuple: (palm, greyscale_palm), the size x size BGR and greyscale images.
+    """
+    # Read the file once; it is decoded from this buffer
+    data = np.fromfile(str(image_path), dtype=np.uint8)
+
+    # Peek at the dimensions to decode no finer than the palm crop needs
+    try:
+        with Image.open(image_path) as peek:
+            short_side = min(peek.size)
+        reduction = coarsest_reduction(int(short_side * PALM_CROP_FRACTION), size)
+    except (OSError, ValueError):
+        reduction = 1
+
+    # Load the image
+    image = decode_image(data, reduction)
+
+    mp_hands = mp.solutions.hands
+
+    # Convert the image to RGB for Mediapipe
+    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGRA2RGB)
+
+    # Borrow a warmed-up detector from the pool when one matches the threshold,
+    # otherwise fall back to a one-off Mediapipe Hands model
+    pool = get_hands_pool()
+    with step("detect"):
+        if pool is not None and pool.threshold == threshold:
+            with pool.checkout() as hands:
+                result = hands.process(image_rgb)
+        else:
+            with mp_hands.Hands(
+                static_image_mode=True,
+                max_num_hands=1,
+                min_detection_confidence=threshold,
+            ) as hands:
+                result = hands.process(image_rgb)
+
+    if not result.multi_hand_landmarks:
+        raise ValueError(
+            "No hand detected in the image. Please upload a better quality image of your hand."
+        )
+
+    # Perform a weighted average of the landmarks to find the center of the hand
+
+    LANDMARKS_OF_INTEREST = {
+        mp_hands.HandLandmark.WRIST: 1,
+        mp_hands.HandLandmark.THUMB_MCP: 1,
+        mp_hands.HandLandmark.INDEX_FINGER_MCP: 1,
+        mp_hands.HandLandmark.MIDDLE_FINGER_MCP: 1,
+        mp_hands.HandLandmark.PINKY_MCP: 1,
+    }
+    # print(result.multi_hand_landmarks)
+
+    # Landmarks are normalized, so they carry over to any decode scale
+    hand_landmarks = result.multi_hand_landmarks[-1]
+    h, w, _ = image.shape
+    x_start, y_start, x_end, y_end = palm_crop_box(
+        hand_landmarks, LANDMARKS_OF_INTEREST, w, h
+    )
+
+    # A palm smaller than expected needs a finer decode to fill `size` pixels
+    crop_side = min(x_end - x_start, y_end - y_start)
+    if reduction > 1 and crop_side < size:
+        reduction = coarsest_reduction(crop_side * reduction, size)
+        image = decode_image(data, reduction)
+        h, w, _ = image.shape
+        x_start, y_start, x_end, y_end = palm_crop_box(
+            hand_landmarks, LANDMARKS_OF_INTEREST, w, h
+        )
+    del data
+
     cropped_palm = image[y_start:y_end, x_start:x_end]
 
     # Resize the cropped palm image
     cropped_palm = cv2.resize(cropped_palm, (size, size))
 
-    # Save the cropped palm image in greyscale
-    cv2.imwrite(str(output_normal_path), cropped_palm, [cv2.IMWRITE_PNG_COMPRESSION, 9])
-
     # greyscale version of the cropped palm
     greyscale_palm = cv2.cvtColor(cropped_palm, cv2.COLOR_BGR2GRAY)
+
+    return cropped_palm, greyscale_palm
+
+
+def save_palm_images(
+    palm,
+    greyscale_palm,
+    output_normal_path: Path,
+    output_greyscale_path: Path,
+    compression: int = PNG_COMPRESSION,
+):
+    """Writes the palm images returned by `crop_palm` as PNG files."""
+    cv2.imwrite(
+        str(output_normal_path), palm, [cv2.IMWRITE_PNG_COMPRESSION, compression]
+    )
     cv2.imwrite(
         str(output_greyscale_path),
         greyscale_palm,
-        [
-            cv2.IMWRITE_PNG_COMPRESSION,
-            9,
-        ],
+        [cv2.IMWRITE_PNG_COMPRESSION, compression],
     )
 
-    # Clean up the Mediapipe Hands object
-    hands.close()
+
+def extract_palm_region(
+    image_path: Path,
+    output_normal_path: Path,
+    output_greyscale_path: Path,
+    size: int,
+    threshold: float = 0.7,
+):
+    palm, greyscale_palm = crop_palm(image_path, size, threshold)
+    save_palm_images(palm, greyscale_palm, output_normal_path, output_greyscale_path)
 
 
 if __name__ == "__main__":
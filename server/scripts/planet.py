@@ -3,21 +3,21 @@ import numpy as np
 import trimesh
 from pathlib import Path
 
+from scripts.sphere_projection import map_to_sphere
+from scripts.tile_mesh import tile_cache
 
-def map_to_sphere(vertices, theta_bounds, phi_bounds, R):
-    """Maps a flat tile's vertices onto a spherical tile."""
-    x, y, z = vertices[:, 0], vertices[:, 1], vertices[:, 2]
 
-    # Scale x and y to longitude and latitude ranges
-    phi = phi_bounds[0] + x * (phi_bounds[1] - phi_bounds[0])
-    theta = theta_bounds[0] + y * (theta_bounds[1] - theta_bounds[0])
-
-    # Project onto sphere (preserving z as height for topography)
-    new_x = (R + z) * np.sin(theta) * np.cos(phi)
-    new_y = (R + z) * np.sin(theta) * np.sin(phi)
-    new_z = (R + z) * np.cos(theta)
-
-    return np.column_stack((new_x, new_y, new_z))
+def _tile_coordinate(values: np.ndarray, size: float, count: int) -> np.ndarray:
+    """
+    Index k of the half-open interval [k * size, (k + 1) * size) holding each
+    value, or -1 when it lies outside all `count` of them.
+    """
+    index = np.floor(values * count).astype(np.intp)
+    # values * count can land one step off the interval bounds' own rounding
+    index[index * size > values] -= 1
+    index[(index + 1) * size <= values] += 1
+    index[(index < 0) | (index >= count)] = -1
+    return index
 
 
 def project_uv_to_sphere(
@@ -30,52 +30,41 @@ def project_uv_to_sphere(
     theta_edges = np.linspace(0, np.pi, rows + 1)  # Latitude (0 to pi)
     phi_edges = np.linspace(0, 2 * np.pi, cols + 1)  # Longitude (0 to 2pi)
 
-    all_vertices = []
-    all_faces = []
-    face_offset = 0
-
-    # Iterate through each tile's corresponding grid position
-    for row in range(rows):
-        for col in range(cols):
-            # Get bounds for the current tile in spherical coordinates
-            theta1, theta2 = theta_edges[row], theta_edges[row + 1]
-            phi1, phi2 = phi_edges[col], phi_edges[col + 1]
-
-            # Determine which vertices and faces belong to this tile
-            mask = (
-                (uv_fabric.vertices[:, 0] >= col * tile_width)
-                & (uv_fabric.vertices[:, 0] < (col + 1) * tile_width)
-                & (uv_fabric.vertices[:, 1] >= row * tile_height)
-                & (uv_fabric.vertices[:, 1] < (row + 1) * tile_height)
-            )
+    vertices = uv_fabric.vertices
+    faces = uv_fabric.faces
 
-            tile_vertices = uv_fabric.vertices[mask]
-            tile_faces = uv_fabric.faces[np.all(mask[uv_fabric.faces], axis=1)]
+    # Find each vertex's tile in one pass, using the same bounds as before
+    col = _tile_coordinate(vertices[:, 0], tile_width, cols)
+    row = _tile_coordinate(vertices[:, 1], tile_height, rows)
+    tile = np.where((col >= 0) & (row >= 0), row * cols + col, -1)
 
-            if tile_vertices.size == 0 or tile_faces.size == 0:
-                continue  # Skip empty tiles
-
-            # Reindex faces to match the current tile's vertex subset
-            unique_indices, new_indices = np.unique(tile_faces, return_inverse=True)
-            tile_vertices = tile_vertices[unique_indices]
-            tile_faces = new_indices.reshape(tile_faces.shape)
-
-            # Map the vertices of this tile to the spherical region
-            mapped_vertices = map_to_sphere(
-                tile_vertices, (theta1, theta2), (phi1, phi2), radius
-            )
-
-            # Append mapped vertices and adjust faces accordingly
-            all_vertices.append(mapped_vertices)
-            all_faces.append(tile_faces + face_offset)
-
-            # Update face offset for the next tile
-            face_offset += len(mapped_vertices)
+    # Keep the faces whose corners all sit in the same tile, grouped by tile
+    face_tile = tile[faces[:, 0]]
+    inside = (
+        (face_tile >= 0)
+        & (tile[faces[:, 1]] == face_tile)
+        & (tile[faces[:, 2]] == face_tile)
+    )
+    faces = faces[inside]
+    faces = faces[np.argsort(face_tile[inside], kind="stable")]
+
+    # Renumber the vertices those faces use, tile by tile, in fabric order
+    used = np.unique(faces)
+    used = used[np.argsort(tile[used], kind="stable")]
+    new_index = np.empty(len(vertices), dtype=np.intp)
+    new_index[used] = np.arange(len(used))
+
+    # Map every vertex to its tile's spherical region
+    used_row, used_col = row[used], col[used]
+    mapped_vertices = map_to_sphere(
+        vertices[used],
+        (theta_edges[used_row], theta_edges[used_row + 1]),
+        (phi_edges[used_col], phi_edges[used_col + 1]),
+        radius,
+    )
 
     # Combine all vertices and faces into a single mesh
-    spherical_mesh = trimesh.Trimesh(
-        vertices=np.vstack(all_vertices), faces=np.vstack(all_faces)
-    )
+    spherical_mesh = trimesh.Trimesh(vertices=mapped_vertices, faces=new_index[faces])
     return spherical_mesh
 
 
@@ -129,14 +118,14 @@ def generate_uv_fabric(
     all_faces = []
     face_offset = 0
 
-    # A dictionary to track vertex connections for smoothing
-    vertex_map = {}
+    # Read the tiles that are not cached yet in parallel
+    tile_cache.prefetch(tile_data.get("path") for tile_data in tiles.values())
 
     # Iterate through tiles and calculate their row and column based on index
     for tile_index, tile_data in tiles.items():
         tile_path = tile_data.get("path")
         try:
-            tile_mesh = trimesh.load(tile_path)
+            tile_mesh = tile_cache.get(tile_path)
             print(f"Tile {tile_index} loaded successfully from {tile_path}.")
         except Exception as e:
             raise ValueError(f"Error loading STL file for tile {tile_index}: {e}")
@@ -154,16 +143,6 @@ def generate_uv_fabric(
         tile_vertices[:, 0] = tile_vertices[:, 0] * tile_width + tile_offset_x
         tile_vertices[:, 1] = tile_vertices[:, 1] * tile_height + tile_offset_y
 
-        # Smooth vertices with adjacent tiles within a margin
-        for i, vertex in enumerate(tile_vertices):
-            key = tuple(vertex.round(decimals=6))  # Round for consistent matching
-            if key in vertex_map:
-                # Only smooth if the vertex is within the margin of the edge
-                distance = np.linalg.norm(vertex - vertex_map[key])
-                if distance <= margin:
-                    tile_vertices[i] = (tile_vertices[i] + vertex_map[key]) / 2
-            vertex_map[key] = tile_vertices[i]
-
         # Append transformed vertices and faces
         all_vertices.append(tile_vertices)
         all_faces.append(tile_mesh.faces + face_offset)
@@ -171,14 +150,82 @@ def generate_uv_fabric(
         # Update face offset for the next tile
         face_offset += len(tile_vertices)
 
+    all_vertices = np.vstack(all_vertices)
+
+    # Smooth vertices with adjacent tiles within a margin
+    smooth_seams(all_vertices, rows, cols, margin)
+
     # Combine all tiles into a single UV fabric
     uv_fabric = trimesh.Trimesh(
-        vertices=np.vstack(all_vertices), faces=np.vstack(all_faces)
+        vertices=all_vertices, faces=np.vstack(all_faces)
     )
 
     return uv_fabric
 
 
+def _on_grid_lines(values: np.ndarray, count: int, tolerance: float = 1e-6):
+    """Whether each value lies on one of the lines k / count, k = 0..count."""
+    scaled = values * count
+    return np.abs(scaled - np.rint(scaled)) <= tolerance * count
+
+
+def smooth_seams(
+    vertices: np.ndarray, rows: int, cols: int, margin: float = 20.0
+) -> np.ndarray:
+    """
+    Blends the vertices that adjacent tiles share along their seams, in place.
+
+    Vertices match when their coordinates agree to 6 decimals. Walking the
+    fabric in order, each matching vertex is averaged with the blended value of
+    the previous one (if they are within `margin`), so a corner shared by four
+    tiles ends up as the same running average as before. Tiles occupy disjoint
+    cells of the fabric, so only vertices on the cell borders are compared.
+
+    Parameters:
+        vertices (numpy.ndarray): (V, 3) fabric vertices, tile after tile.
+        rows (int): Number of tile rows in the fabric.
+        cols (int): Number of tile columns in the fabric.
+        margin (float): Largest distance between two vertices that get blended.
+
+    Returns:
+        numpy.ndarray: The same array, smoothed.
+    """
+    border = np.flatnonzero(
+        _on_grid_lines(vertices[:, 0], cols) | _on_grid_lines(vertices[:, 1], rows)
+    )
+    if len(border) == 0:
+        return vertices
+
+    # Group the border vertices by rounded position (+ 0.0 folds -0.0 into 0.0)
+    keys = vertices[border].round(decimals=6) + 0.0
+    _, group, counts = np.unique(
+        keys, axis=0, return_inverse=True, return_counts=True
+    )
+    group = group.ravel()
+    shared = counts[group] > 1
+    border, group = border[shared], group[shared]
+    if len(border) == 0:
+        return vertices
+
+    # Order each group's vertices the way the fabric lists them
+    order = np.lexsort((border, group))
+    border, group = border[order], group[order]
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    rank = np.arange(len(group)) - np.repeat(starts, np.diff(np.r_[starts, len(group)]))
+
+    # Fold each group left to right: blended[k] = (v[k] + blended[k - 1]) / 2
+    blended = vertices[border]
+    for k in range(1, rank.max() + 1):
+        current = np.flatnonzero(rank == k)
+        previous = blended[current - 1]
+        close = np.linalg.norm(blended[current] - previous, axis=1) <= margin
+        current, previous = current[close], previous[close]
+        blended[current] = (blended[current] + previous) / 2
+
+    vertices[border] = blended
+    return vertices
+
+
 if __name__ == "__main__":
     json_file_path = Path("data/planet.json")
     output_uv_path = Path("debug/output_uv_fabric.stl")
@@ -1,73 +1,226 @@
 import numpy as np
 import trimesh
 import os
+import threading
+import time
 
+from scripts.glb import glb_path, write_glb
+from scripts.lod import LOD_LEVELS, grid_lods, lod_path
+from scripts.metrics import step
+from scripts.sphere_projection import project_tile, tiling
+from scripts.stl_io import StlWriter, iter_stl, stl_size
+from scripts.tile_mesh import tile_cache
 
-def map_to_sphere(vertices, theta_bounds, phi_bounds, R):
-    """
-    Maps a flat tile's vertices onto a spherical tile.
+
+class IncrementalTiledSphere:
     """
-    x, y, z = vertices[:, 0], vertices[:, 1], vertices[:, 2]
-    phi = phi_bounds[0] + x * (phi_bounds[1] - phi_bounds[0])
-    theta = theta_bounds[0] + y * (theta_bounds[1] - theta_bounds[0])
-    new_x = (R + z) * np.sin(theta) * np.cos(phi)
-    new_y = (R + z) * np.sin(theta) * np.sin(phi)
-    new_z = (R + z) * np.cos(theta)
-    return np.column_stack((new_x, new_y, new_z))
+    Builds the collective planet one tile at a time.
 
+    The projected vertices and faces of every filled slot are kept in memory,
+    so adding a visitor's landscape only loads and projects that one tile
+    instead of re-reading the whole landscapes folder. Slots are filled in
+    upload order; once all of them are taken the oldest tile is replaced, so
+    the planet always shows the most recent visitors.
 
-def create_tiled_sphere_from_folder(input_folder, output_stl_path, R=1, N=5):
-    """
-    Creates a tiled sphere using multiple STL files from a folder.
+    Each slot also keeps its reduced levels of detail (see `scripts.lod`), so
+    every level can be exported or streamed without projecting again.
     """
-    stl_files = [
-        os.path.join(input_folder, f)
-        for f in os.listdir(input_folder)
-        if f.endswith(".stl")
-    ]
-    if len(stl_files) < N:
-        print(
-            f"Warning: Only found {len(stl_files)} STL files, expected {N}. Some areas will be left blank, which is normal behavior."
-        )
 
-    tile_meshes = [trimesh.load(stl_files[i]) for i in range(len(stl_files))]
+    def __init__(self, input_folder, R=1, N=5):
+        self.input_folder = input_folder
+        self.R = R
 
-    M = int(np.sqrt(N))  # Latitude bands
-    N_per_band = int(N / M)  # Tiles per band
-    theta_edges = np.linspace(0, np.pi, M + 1)
-    phi_edges = np.linspace(0, 2 * np.pi, N_per_band + 1)
+        self.M, self.N_per_band = tiling(N)
+        self.capacity = self.M * self.N_per_band
 
-    all_vertices = []
-    all_faces = []
-    face_offset = 0
+        self.slot_paths = [None] * self.capacity
+        # Stored as float32/int32, the precision STL files are written with anyway
+        self.slot_vertices = [None] * self.capacity
+        self.slot_faces = [None] * self.capacity
+        # slot -> {level: (vertices, faces)} for the reduced levels of detail
+        self.slot_lods = [None] * self.capacity
+        self.next_slot = 0
+        self.loaded = False
 
-    tile_idx = 0
-    for lat_idx in range(len(theta_edges) - 1):
-        for lon_idx in range(len(phi_edges) - 1):
-            if tile_idx >= len(tile_meshes):
-                continue  # Proceed with blank areas as normal behavior
+        self._lock = threading.Lock()
+        self._started = time.time_ns()
+        self.revision = 0
 
-            tile_mesh = tile_meshes[tile_idx]
-            theta_bounds = (theta_edges[lat_idx], theta_edges[lat_idx + 1])
-            phi_bounds = (phi_edges[lon_idx], phi_edges[lon_idx + 1])
+    def load(self):
+        """
+        Fills the slots from the landscapes already on disk, oldest first.
 
-            mapped_vertices = map_to_sphere(
-                tile_mesh.vertices, theta_bounds, phi_bounds, R
+        A tile that cannot be read is reported and left out, so one damaged
+        file does not keep the planet from loading.
+        """
+        try:
+            stl_files = sorted(
+                (
+                    os.path.join(self.input_folder, f)
+                    for f in os.listdir(self.input_folder)
+                    if f.endswith(".stl")
+                ),
+                key=os.path.getmtime,
             )
-            all_vertices.append(mapped_vertices)
-            all_faces.append(tile_mesh.faces + face_offset)
-            face_offset += len(mapped_vertices)
-            tile_idx += 1
-
-    # Ensure an STL file is exported even if some tiles are missing
-    all_vertices = np.vstack(all_vertices) if all_vertices else np.empty((0, 3))
-    all_faces = np.vstack(all_faces) if all_faces else np.empty((0, 3), dtype=int)
-
-    tiled_sphere_mesh = trimesh.Trimesh(vertices=all_vertices, faces=all_faces)
-    tiled_sphere_mesh.export(output_stl_path)
-    print(
-        f"Tiled sphere saved to {output_stl_path}, even if some areas are left blank."
-    )
+            if len(stl_files) < self.capacity:
+                print(
+                    f"Warning: Only found {len(stl_files)} STL files, expected {self.capacity}. Some areas will be left blank, which is normal behavior."
+                )
+
+            # Read the tiles that are not cached yet in parallel, then project them in order
+            with step("read"):
+                tile_cache.prefetch(stl_files[-self.capacity :])
+            for stl_file in stl_files[-self.capacity :]:
+                try:
+                    self._place(stl_file)
+                except Exception as e:
+                    print(f"Skipping tile {stl_file}: {str(e)}")
+        finally:
+            # Never load again, even after an error: new tiles are still added
+            self.loaded = True
+
+    def add_tile(self, tile_path):
+        """
+        Projects one landscape into its slot and returns the slot index.
+
+        A tile that is already on the planet (e.g. a re-upload) is re-projected
+        in place rather than taking a new slot.
+        """
+        if not self.loaded:
+            self.load()
+        return self._place(tile_path)
+
+    def _place(self, tile_path):
+        tile_path = os.path.normpath(str(tile_path))
+        # The cached arrays are read-only, so the slot can share the faces.
+        # Read before taking a slot, so a tile that fails leaves no gap
+        tile_vertices, tile_faces = tile_cache.arrays(tile_path)
+
+        if tile_path in self.slot_paths:
+            slot = self.slot_paths.index(tile_path)
+        else:
+            slot = self.next_slot
+            self.next_slot = (self.next_slot + 1) % self.capacity
+
+        mapped_vertices = project_tile(
+            np.asarray(tile_vertices, dtype=np.float64),
+            slot,
+            self.M,
+            self.N_per_band,
+            self.R,
+        ).astype(np.float32)
+
+        lods = grid_lods(tile_vertices) or {}
+        slot_lods = {
+            lod: (mapped_vertices[kept], lod_faces)
+            for lod, (kept, lod_faces) in lods.items()
+        }
+
+        # Swap the slot in at once, so readers never see half of a tile
+        with self._lock:
+            self.slot_paths[slot] = tile_path
+            self.slot_vertices[slot] = mapped_vertices
+            self.slot_faces[slot] = tile_faces
+            self.slot_lods[slot] = slot_lods
+            self.revision += 1
+
+        return slot
+
+    def snapshot(self, lod=0):
+        """
+        Returns (etag, parts): a version tag for the current planet and the
+        (vertices, faces) of its filled slots at a level of detail.
+
+        Slots are replaced rather than modified, so the parts stay valid while
+        the planet keeps growing, e.g. during a download. Tiles that are not
+        on the regular grid have no reduced levels and are given in full.
+        """
+        with self._lock:
+            parts = [
+                self.slot_lods[slot].get(
+                    lod, (self.slot_vertices[slot], self.slot_faces[slot])
+                )
+                for slot in range(self.capacity)
+                if self.slot_paths[slot] is not None
+            ]
+            etag = f"{self._started:x}-{self.revision:x}"
+        return (f'"{etag}-lod{lod}"' if lod else f'"{etag}"'), parts
+
+    def assemble(self, parts=None):
+        """Returns the (vertices, faces) of the filled slots as one indexed mesh."""
+        if parts is None:
+            _, parts = self.snapshot()
+        if not parts:
+            return np.empty((0, 3), dtype=np.float32), np.empty((0, 3), dtype=np.int32)
+
+        offsets = np.cumsum([0] + [len(vertices) for vertices, _ in parts])
+        all_vertices = np.vstack([vertices for vertices, _ in parts])
+        all_faces = np.vstack(
+            [faces + offset for (_, faces), offset in zip(parts, offsets)]
+        )
+        return all_vertices, all_faces
+
+    def to_mesh(self):
+        """Assembles the filled slots into one mesh, leaving empty slots blank."""
+        all_vertices, all_faces = self.assemble()
+
+        # The tiles are already clean, so skip trimesh's vertex merging
+        return trimesh.Trimesh(vertices=all_vertices, faces=all_faces, process=False)
+
+    def stl_stream(self, lod=0):
+        """
+        Returns (etag, size, chunks): the planet as a binary STL generated one
+        slot at a time, without assembling it or writing it to disk.
+        """
+        etag, parts = self.snapshot(lod)
+        size = stl_size(sum(len(faces) for _, faces in parts))
+        return etag, size, iter_stl(parts, unit_normals=True)
+
+    def export(self, output_stl_path):
+        _, parts = self.snapshot()
+
+        # Stream each slot's triangles straight into the STL file
+        triangle_count = sum(len(faces) for _, faces in parts)
+        with StlWriter(output_stl_path, triangle_count) as stl_writer:
+            for vertices, faces in parts:
+                stl_writer.write(vertices, faces, unit_normals=True)
+
+        write_glb(glb_path(output_stl_path), *self.assemble(parts))
+        print(
+            f"Tiled sphere saved to {output_stl_path}, even if some areas are left blank."
+        )
+
+    def export_glb(self, output_glb_path):
+        """
+        Writes the planet as GLB, one file per level of detail, replacing any
+        previous files atomically.
+        """
+        for lod in LOD_LEVELS:
+            lod_glb_path = lod_path(output_glb_path, lod)
+            partial_path = lod_glb_path.with_name(lod_glb_path.name + ".part")
+            _, parts = self.snapshot(lod)
+            write_glb(partial_path, *self.assemble(parts))
+            os.replace(partial_path, lod_glb_path)
+
+    def update(self, tile_path, output_glb_path=None):
+        """
+        Adds a new landscape. The STL is generated on request (see stl_stream),
+        so only the compact GLB is written, if a path is given.
+        """
+        with step("place"):
+            self.add_tile(tile_path)
+        if output_glb_path is not None:
+            with step("export"):
+                self.export_glb(output_glb_path)
+
+
+def create_tiled_sphere_from_folder(input_folder, output_stl_path, R=1, N=5):
+    """
+    Creates a tiled sphere using multiple STL files from a folder.
+    """
+    tiled_sphere = IncrementalTiledSphere(input_folder, R=R, N=N)
+    tiled_sphere.load()
+    tiled_sphere.export(output_stl_path)
 
 
 if __name__ == "__main__":
@@ -1,32 +1,10 @@
 import numpy as np
-import trimesh
 
-
-def map_to_sphere(vertices, theta_bounds, phi_bounds, R):
-    """
-    Maps a flat tile's vertices onto a spherical tile.
-
-    Parameters:
-        vertices (numpy.ndarray): Array of vertices to be mapped.
-        theta_bounds (tuple): Latitude bounds (theta_min, theta_max).
-        phi_bounds (tuple): Longitude bounds (phi_min, phi_max).
-        R (float): Radius of the sphere.
-
-    Returns:
-        numpy.ndarray: Array of vertices mapped onto the spherical tile.
-    """
-    x, y, z = vertices[:, 0], vertices[:, 1], vertices[:, 2]
-
-    # Scale x and y to longitude and latitude ranges
-    phi = phi_bounds[0] + x * (phi_bounds[1] - phi_bounds[0])
-    theta = theta_bounds[0] + y * (theta_bounds[1] - theta_bounds[0])
-
-    # Project onto sphere (preserving z as height for topography)
-    new_x = (R + z) * np.sin(theta) * np.cos(phi)
-    new_y = (R + z) * np.sin(theta) * np.sin(phi)
-    new_z = (R + z) * np.cos(theta)
-
-    return np.column_stack((new_x, new_y, new_z))
+from scripts.glb import glb_path, write_glb
+from scripts.lod import grid_lods, lod_path
+from scripts.sphere_projection import project_tile, tiling, to_grid_order
+from scripts.stl_io import StlWriter
+from scripts.tile_mesh import load_tile_mesh
 
 
 def create_tiled_sphere(input_stl_path, output_stl_path, R=1, N=5):
@@ -44,49 +22,78 @@ def create_tiled_sphere(input_stl_path, output_stl_path, R=1, N=5):
     """
     # Load the STL file
     try:
-        tile_mesh = trimesh.load(input_stl_path)
+        tile_mesh = load_tile_mesh(input_stl_path)
         print("STL file loaded successfully!")
     except Exception as e:
         print(f"Error loading STL file: {e}")
         return
 
-    # Compute tiling parameters
-    M = int(np.sqrt(N))  # Number of latitude bands
-    N_per_band = int(N / M)  # Number of tiles per latitude band
-    theta_edges = np.linspace(0, np.pi, M + 1)  # Latitude edges
-    phi_edges = np.linspace(0, 2 * np.pi, N_per_band + 1)  # Longitude edges
+    tiled_sphere_from_tile(
+        tile_mesh.vertices, tile_mesh.faces, output_stl_path, R=R, N=N
+    )
 
-    # Initialize arrays for the full sphere
-    all_vertices = []
-    all_faces = []
-    face_offset = 0
 
-    # Map each tile onto the spherical surface
-    for lat_idx in range(len(theta_edges) - 1):
-        for lon_idx in range(len(phi_edges) - 1):
-            # Bounds for the current tile
-            theta_bounds = (theta_edges[lat_idx], theta_edges[lat_idx + 1])
-            phi_bounds = (phi_edges[lon_idx], phi_edges[lon_idx + 1])
+def tiled_sphere_from_tile(vertices, faces, output_stl_path, R=1, N=5):
+    """
+    Creates a tiled sphere from a tile that is already in memory.
 
-            # Map vertices to spherical tile
-            mapped_vertices = map_to_sphere(
-                tile_mesh.vertices, theta_bounds, phi_bounds, R
-            )
+    Tiles on the regular landscape grid also get reduced levels of detail
+    (see `scripts.lod`), written next to the output as `_lod1`, `_lod2`, ...
 
-            # Append mapped vertices and adjusted faces
-            all_vertices.append(mapped_vertices)
-            all_faces.append(tile_mesh.faces + face_offset)
+    Parameters:
+        vertices (numpy.ndarray): (V, 3) tile vertices, e.g. from `read_tile_mesh`.
+        faces (numpy.ndarray): (F, 3) tile faces.
+        output_stl_path (str): Path to save the output STL file.
+        R (float): Radius of the sphere.
+        N (int): Total number of tiles.
 
-            # Update face offset
-            face_offset += len(mapped_vertices)
+    Returns:
+        None
+    """
+    # Compute tiling parameters
+    M, N_per_band = tiling(N)
+
+    # Project in double precision, as from a loaded mesh
+    vertices = np.asarray(vertices, dtype=np.float64)
+
+    # Put the tile in landscape grid order once and reuse it for every slot
+    tile_vertices, tile_faces, index = to_grid_order(vertices, faces)
+
+    slots = M * N_per_band
+    tile_faces = tile_faces.astype(np.int32)
 
-    # Combine all vertices and faces into a single mesh
-    all_vertices = np.vstack(all_vertices)
-    all_faces = np.vstack(all_faces)
-    tiled_sphere_mesh = trimesh.Trimesh(vertices=all_vertices, faces=all_faces)
+    # Stream each slot's triangles straight into the STL file
+    all_vertices = []
+    with StlWriter(output_stl_path, slots * len(tile_faces)) as stl_writer:
+        # Map each tile onto the spherical surface
+        for slot in range(slots):
+            # Map vertices to spherical tile
+            mapped_vertices = project_tile(
+                tile_vertices, slot, M, N_per_band, R, index=index
+            )
+            stl_writer.write(mapped_vertices, tile_faces, unit_normals=True)
+            all_vertices.append(mapped_vertices.astype(np.float32))
+
+    # The GLB twin needs the whole mesh, with each slot's faces offset
+    all_faces = np.vstack(
+        [tile_faces + slot * len(tile_vertices) for slot in range(slots)]
+    )
+    write_glb(glb_path(output_stl_path), np.vstack(all_vertices), all_faces)
+
+    # The reduced levels of detail keep a subset of each projected slot, and
+    # are written after the full mesh so they are never older than it
+    for lod, (kept, lod_faces) in (grid_lods(tile_vertices) or {}).items():
+        lod_vertices = [slot_vertices[kept] for slot_vertices in all_vertices]
+        lod_stl_path = lod_path(output_stl_path, lod)
+        with StlWriter(lod_stl_path, slots * len(lod_faces)) as stl_writer:
+            for slot_vertices in lod_vertices:
+                stl_writer.write(slot_vertices, lod_faces, unit_normals=True)
+
+        all_faces = np.vstack(
+            [lod_faces + slot * len(kept) for slot in range(slots)]
+        )
+        write_glb(glb_path(lod_stl_path), np.vstack(lod_vertices), all_faces)
 
-    # Save the tiled sphere mesh to an STL file
-    tiled_sphere_mesh.export(output_stl_path)
     print(f"Tiled sphere saved to {output_stl_path}")
 
 
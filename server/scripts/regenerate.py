@@ -0,0 +1,294 @@
+"""
+Regenerates every visitor's landscape and planet, and the collective planet,
+from the greyscale palms on disk.
+
+Run it from the server folder, with the server stopped (the server keeps the
+collective planet and the latest files in memory):
+
+    python -m scripts.regenerate [--workers 8] [--sigma 5] [--tiles 50] ...
+
+Visitors already regenerated with the same parameters are skipped, so an
+interrupted run picks up where it stopped.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from PIL import Image
+
+from scripts.glb import glb_path
+from scripts.heightmap import BLUR_BACKENDS
+from scripts.landscape import landscape_mesh, save_landscape
+from scripts.lod import LOD_LEVELS, lod_path
+from scripts.metrics import measured
+from scripts.planet_multitile import IncrementalTiledSphere
+from scripts.planet_one_palm import tiled_sphere_from_tile
+from scripts.result_cache import ResultCache
+from scripts.sphere_projection import tiling
+from scripts.tile_mesh import indexed_arrays, indexed_path
+
+GREYSCALE_SUFFIX = "_palm_greyscale.png"
+# Parameter keys of the visitors regenerated so far, by file stem
+MANIFEST_FILE = "regenerated.json"
+
+
+class Visitor:
+    """The files of one visitor, named after the hash of their photo."""
+
+    def __init__(self, data_folder: Path, greyscale_path: Path):
+        self.greyscale = greyscale_path
+        self.stem = greyscale_path.name[: -len(GREYSCALE_SUFFIX)]
+        self.landscape = data_folder / "landscapes" / f"{self.stem}_landscapes.stl"
+        self.planet = data_folder / "planets" / f"{self.stem}_planet.stl"
+
+    def outputs(self, lods=True) -> list:
+        """Every file regenerated for the visitor, twins after their STL."""
+        outputs = [
+            self.landscape,
+            indexed_path(self.landscape),
+            glb_path(self.landscape),
+            self.planet,
+            glb_path(self.planet),
+        ]
+        for lod in LOD_LEVELS[1:] if lods else ():
+            planet_lod = lod_path(self.planet, lod)
+            outputs += [planet_lod, glb_path(planet_lod)]
+        return outputs
+
+
+def find_visitors(data_folder: Path) -> list:
+    """The visitors with a greyscale palm, in upload order."""
+    greyscale_folder = data_folder / "images" / "palms" / "greyscale"
+    paths = [
+        path
+        for path in greyscale_folder.glob(f"*{GREYSCALE_SUFFIX}")
+        if not path.name.startswith(".")
+    ]
+    # The palm images are written once per upload, so they keep the upload order
+    paths.sort(key=lambda path: path.stat().st_mtime)
+    return [Visitor(data_folder, path) for path in paths]
+
+
+def load_manifest(path: Path) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path: Path, manifest: dict):
+    partial = path.with_name(f".{path.name}.part")
+    with open(partial, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(partial, path)
+
+
+def regenerate_visitor(greyscale_path, landscape_path, planet_path, params):
+    """
+    Rebuilds a visitor's landscape and planet from their greyscale palm.
+
+    Returns:
+        tuple: (landscape triangles, planet triangles).
+    """
+    with Image.open(greyscale_path) as greyscale_palm:
+        vertices, faces = landscape_mesh(
+            greyscale_palm,
+            sigma=params["sigma"],
+            margin=params["margin"],
+            max_error=params["max_error"],
+            blur=params["blur"],
+        )
+    save_landscape(landscape_path, vertices, faces)
+
+    # The planet gets the tile exactly as it is read back from disk
+    tile_vertices, tile_faces = indexed_arrays(vertices, faces)
+    tiled_sphere_from_tile(
+        tile_vertices, tile_faces, planet_path, R=params["R"], N=params["N"]
+    )
+    M, N_per_band = tiling(params["N"])
+    return len(faces), len(faces) * M * N_per_band
+
+
+def _regenerate(visitor: Visitor, params: dict):
+    # Outputs may be hard links into the server's result cache, so replace
+    # them, never overwrite them (and drop levels of detail no longer made)
+    for path in visitor.outputs():
+        path.unlink(missing_ok=True)
+    return measured(
+        regenerate_visitor, visitor.greyscale, visitor.landscape, visitor.planet, params
+    )
+
+
+def touch_in_upload_order(visitors: list, lods: bool):
+    """
+    Gives the outputs fresh modification times in upload order, since the
+    latest files and the collective planet's tiles are picked by them.
+    """
+    # Set 1 µs apart, since files are stamped with a coarser clock than that
+    now = time.time_ns()
+    paths = [path for visitor in visitors for path in visitor.outputs(lods)]
+    for i, path in enumerate(paths):
+        if path.exists():
+            mtime = now + (i - len(paths)) * 1000
+            os.utime(path, ns=(mtime, mtime))
+
+
+def regenerate(data_folder, params: dict, workers=None, force=False, dry_run=False):
+    """
+    Regenerates the landscapes and planets that are missing or were made
+    with other parameters, then the collective planet.
+
+    Parameters:
+        data_folder (str): The server's data folder.
+        params (dict): sigma, margin, max_error, blur, R and N.
+        workers (int): Worker processes, one per core by default.
+        force (bool): Regenerate every visitor, even if up to date.
+        dry_run (bool): Only report what would be regenerated.
+
+    Returns:
+        int: The number of visitors that could not be regenerated.
+    """
+    data_folder = Path(data_folder)
+    manifest_path = data_folder / MANIFEST_FILE
+    manifest = load_manifest(manifest_path)
+    # Adaptively triangulated landscapes are not on a grid to decimate
+    lods = params["max_error"] is None
+
+    visitors = find_visitors(data_folder)
+    stale = [
+        visitor
+        for visitor in visitors
+        if force
+        or manifest.get(visitor.stem) != ResultCache.key(visitor.stem, params)
+        or not all(path.exists() for path in visitor.outputs(lods))
+    ]
+    print(
+        f"{len(visitors)} visitors, {len(visitors) - len(stale)} up to date, "
+        f"{len(stale)} to regenerate."
+    )
+    if dry_run:
+        for visitor in stale:
+            print(f"Would regenerate {visitor.stem}")
+        return 0
+
+    (data_folder / "landscapes").mkdir(parents=True, exist_ok=True)
+    (data_folder / "planets").mkdir(parents=True, exist_ok=True)
+
+    failed = 0
+    triangles = 0
+    output_bytes = 0
+    start = time.perf_counter()
+    if stale:
+        # Spawn like the server's pipeline, so workers start from a clean state
+        with ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as pool:
+            futures = {
+                pool.submit(_regenerate, visitor, params): visitor for visitor in stale
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                visitor = futures[future]
+                try:
+                    (landscape_triangles, planet_triangles), sample = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"Could not regenerate {visitor.stem}: {str(e)}")
+                    continue
+
+                manifest[visitor.stem] = ResultCache.key(visitor.stem, params)
+                save_manifest(manifest_path, manifest)
+
+                triangles += landscape_triangles + planet_triangles
+                output_bytes += sum(
+                    path.stat().st_size for path in visitor.outputs(lods)
+                )
+                print(
+                    f"[{done}/{len(stale)}] {visitor.stem}: "
+                    f"{landscape_triangles} + {planet_triangles} triangles in "
+                    f"{sample['duration']:.2f} s, "
+                    f"peak RSS {sample['peak_rss'] / 2**20:.0f} MiB"
+                )
+
+        touch_in_upload_order(visitors, lods)
+
+    elapsed = time.perf_counter() - start
+    regenerated = len(stale) - failed
+    if regenerated:
+        print(
+            f"Regenerated {regenerated} visitors in {elapsed:.1f} s: "
+            f"{regenerated / elapsed * 60:.1f} visitors/min, "
+            f"{triangles / elapsed / 1e6:.2f} M triangles/s, "
+            f"{output_bytes / elapsed / 2**20:.0f} MiB/s written."
+        )
+
+    # The collective planet shows the most recent landscapes
+    collective_path = data_folder / "planet" / "collective_planet.glb"
+    if regenerated or not collective_path.exists():
+        collective_path.parent.mkdir(parents=True, exist_ok=True)
+        start = time.perf_counter()
+        collective_planet = IncrementalTiledSphere(
+            str(data_folder / "landscapes"), R=params["R"], N=params["N"]
+        )
+        collective_planet.load()
+        collective_planet.export_glb(collective_path)
+        print(
+            f"Collective planet saved to {collective_path} "
+            f"in {time.perf_counter() - start:.1f} s."
+        )
+
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Regenerate every landscape and planet from the palms on disk."
+    )
+    parser.add_argument("--data", default="data", help="The server's data folder.")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Worker processes (default: cores)."
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Regenerate visitors already up to date."
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only list what would be regenerated."
+    )
+    parser.add_argument("--sigma", type=float, default=5.0)
+    parser.add_argument("--margin", type=int, default=20)
+    parser.add_argument(
+        "--max-error",
+        type=float,
+        default=float(os.environ.get("CONFLUX_LANDSCAPE_MAX_ERROR", 0)),
+        help="Adaptive triangulation error, 0 for the full grid.",
+    )
+    parser.add_argument(
+        "--blur",
+        choices=BLUR_BACKENDS,
+        default=os.environ.get("CONFLUX_LANDSCAPE_BLUR", "scipy"),
+    )
+    parser.add_argument("--radius", type=float, default=1.0, help="Planet radius.")
+    parser.add_argument("--tiles", type=int, default=50, help="Tiles per planet.")
+    args = parser.parse_args(argv)
+
+    params = {
+        "sigma": args.sigma,
+        "margin": args.margin,
+        "max_error": args.max_error or None,
+        "blur": args.blur,
+        "R": args.radius,
+        "N": args.tiles,
+    }
+    failed = regenerate(args.data, params, args.workers, args.force, args.dry_run)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
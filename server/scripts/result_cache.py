@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+
+def _link(source: Path, destination: Path):
+    """Hard-links `source` to `destination` (copying across devices), replacing it."""
+    if destination.exists() and os.path.samefile(source, destination):
+        return  # rename() would keep both names of the same file, so stop here
+    partial = destination.with_name(f".{destination.name}.{uuid.uuid4().hex}")
+    try:
+        os.link(source, partial)
+    except OSError:
+        shutil.copy2(source, partial)
+    os.replace(partial, destination)
+
+
+class ResultCache:
+    """
+    Pipeline outputs addressed by the uploaded image's hash and the pipeline
+    parameters.
+
+    Each entry is a folder of hard links to the artifacts of one run, so
+    caching costs no copying and an entry outlives the visitor files it was
+    made from. A repeated upload restores the artifacts (again as hard links)
+    under its own file names instead of running the pipeline.
+
+    The budget counts the disk an entry alone holds: files still linked from
+    visitor outputs (or other entries) would not be freed by deleting it, so
+    only files without another link count. Once these add up to more than
+    `max_bytes`, the least recently used entries holding any are deleted.
+    Visitor outputs are named after the image hash, so an entry's files only
+    lose their other links when outputs of the same hash are replaced or
+    deleted: sizes are measured at startup, and afterwards only for the
+    entries of a hash being restored, stored or released.
+
+    Restoring and storing link files and may delete whole entries, so the
+    server calls them off the event loop; a lock keeps the bookkeeping
+    consistent across threads.
+    """
+
+    def __init__(self, folder: Path, max_bytes: int):
+        self.folder = Path(folder)
+        self.max_bytes = max_bytes
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+
+        # key -> bytes held by the entry alone, least recently used first
+        self._entries = OrderedDict()
+        # image hash -> keys of its entries, and the running total of _entries
+        self._by_hash = {}
+        self._nbytes = 0
+        entries = [path for path in self.folder.iterdir() if path.is_dir()]
+        for entry in sorted(entries, key=lambda path: path.stat().st_mtime):
+            if entry.name.startswith("."):
+                shutil.rmtree(entry, ignore_errors=True)  # Interrupted store
+                continue
+            self._add(entry.name)
+
+    @staticmethod
+    def _exclusive_bytes(entry: Path) -> int:
+        """Bytes that deleting an entry frees: its files with no other link."""
+        total = 0
+        for path in entry.iterdir():
+            stat = path.stat()
+            if stat.st_nlink == 1:
+                total += stat.st_size
+        return total
+
+    @property
+    def nbytes(self) -> int:
+        """Disk held by the cache alone, as last measured."""
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(file_hash: str, params: dict) -> str:
+        """The entry name for an image hash and the parameters it was processed with."""
+        encoded = json.dumps(params, sort_keys=True).encode()
+        return f"{file_hash}_{hashlib.sha1(encoded).hexdigest()[:16]}"
+
+    @staticmethod
+    def _hash_of(key: str) -> str:
+        return key.rsplit("_", 1)[0]
+
+    def _add(self, key: str):
+        self._entries.setdefault(key, 0)
+        self._entries.move_to_end(key)
+        self._by_hash.setdefault(self._hash_of(key), set()).add(key)
+        self._measure(key)
+
+    def _measure(self, key: str):
+        """Updates an entry's size, and the total, from the disk."""
+        try:
+            nbytes = self._exclusive_bytes(self.folder / key)
+        except OSError:
+            return  # Checked again on lookup
+        self._nbytes += nbytes - self._entries[key]
+        self._entries[key] = nbytes
+
+    def _measure_hash(self, file_hash: str):
+        for key in self._by_hash.get(file_hash, ()):
+            self._measure(key)
+
+    def release(self, file_hash: str):
+        """
+        Measures again the entries of an image hash after its visitor outputs
+        were deleted, then enforces the budget.
+        """
+        with self._lock:
+            self._measure_hash(file_hash)
+            evicted = self._evict()
+        for path in evicted:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def lookup(self, key: str) -> dict:
+        """Returns {artifact name: cached path}, or None on a miss."""
+        with self._lock:
+            return self._lookup(key)
+
+    def _lookup(self, key: str) -> dict:
+        if key not in self._entries:
+            return None
+
+        entry = self.folder / key
+        try:
+            with open(entry / "manifest.json") as f:
+                manifest = json.load(f)
+            artifacts = {name: entry / filename for name, filename in manifest.items()}
+            if not all(path.exists() for path in artifacts.values()):
+                raise FileNotFoundError(entry)
+        except (OSError, ValueError):
+            shutil.rmtree(self._remove(key), ignore_errors=True)
+            return None
+
+        self._entries.move_to_end(key)
+        os.utime(entry)  # Remember the use across restarts
+        return artifacts
+
+    def restore(self, key: str, destinations: dict) -> bool:
+        """
+        Links the cached artifacts to {artifact name: path}; False on a miss.
+
+        The restored files are touched in the given order, since the latest
+        files and the collective planet's tiles are picked by modification
+        time (and twins must not be older than their STL).
+        """
+        with self._lock:
+            artifacts = self._lookup(key)
+            if artifacts is None or not set(destinations) <= set(artifacts):
+                return False
+
+            # Linked under the lock, so eviction cannot delete them midway
+            for name, destination in destinations.items():
+                _link(artifacts[name], Path(destination))
+                os.utime(destination)
+
+            # The replaced outputs may have been the last other links of
+            # another entry of the same image
+            self._measure_hash(self._hash_of(key))
+            evicted = self._evict()
+
+        for path in evicted:
+            shutil.rmtree(path, ignore_errors=True)
+        return True
+
+    def store(self, key: str, artifacts: dict):
+        """Caches {artifact name: path} under `key`, then enforces the budget."""
+        with self._lock:
+            if key in self._entries:
+                self._lookup(key)
+                return
+
+        # Build the entry aside and rename it into place, so it is never partial
+        entry = self.folder / key
+        partial = self.folder / f".{key}.{uuid.uuid4().hex}"
+        partial.mkdir()
+        try:
+            manifest = {}
+            for name, source in artifacts.items():
+                source = Path(source)
+                filename = name + source.suffix
+                _link(source, partial / filename)
+                manifest[name] = filename
+            with open(partial / "manifest.json", "w") as f:
+                json.dump(manifest, f)
+        except Exception:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+
+        with self._lock:
+            if entry.exists():
+                shutil.rmtree(entry)
+            partial.rename(entry)
+            self._add(key)
+            # The outputs replaced before the run may have been the last other
+            # links of another entry of the same image
+            self._measure_hash(self._hash_of(key))
+            evicted = self._evict()
+
+        # Delete outside the lock, so restores need not wait for it
+        for path in evicted:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _evict(self) -> list:
+        """Drops entries until the budget is met; returns their folders to delete."""
+        evicted = []
+        if self._nbytes <= self.max_bytes:
+            return evicted
+
+        # Oldest first, skipping entries whose deletion would free nothing,
+        # and keeping the newest entry even if it alone is over budget
+        for key in list(self._entries)[:-1]:
+            if self._nbytes <= self.max_bytes:
+                break
+            if self._entries[key]:
+                evicted.append(self._remove(key))
+        return evicted
+
+    def _remove(self, key: str) -> Path:
+        """Forgets an entry and moves its folder aside; returns it for deletion."""
+        self._nbytes -= self._entries.pop(key, 0)
+        keys = self._by_hash.get(self._hash_of(key), set())
+        keys.discard(key)
+        if not keys:
+            self._by_hash.pop(self._hash_of(key), None)
+        doomed = self.folder / f".{key}.{uuid.uuid4().hex}"
+        try:
+            os.rename(self.folder / key, doomed)
+        except OSError:
+            return self.folder / key
+        return doomed
@@ -0,0 +1,166 @@
+import numpy as np
+
+
+def _root_triangles(tile_size):
+    # (a, b, c) corner coordinates as (x, y) pairs; a-b is the hypotenuse
+    return np.array(
+        [
+            [[0, 0], [tile_size, tile_size], [tile_size, 0]],
+            [[tile_size, tile_size], [0, 0], [0, tile_size]],
+        ],
+        dtype=np.int64,
+    )
+
+
+def _split(triangles):
+    """Splits each triangle (a, b, c) at the middle m of a-b: (c, a, m), (b, c, m)."""
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    m = (a + b) >> 1
+    children = np.empty((len(triangles), 2, 3, 2), dtype=triangles.dtype)
+    children[:, 0] = np.stack((c, a, m), axis=1)
+    children[:, 1] = np.stack((b, c, m), axis=1)
+    return children.reshape(-1, 3, 2)
+
+
+def _flat(points, grid_size):
+    return points[..., 1] * grid_size + points[..., 0]
+
+
+def _triangle_errors(triangles, heights, grid_size):
+    """Largest vertical distance between each triangle and the samples it covers."""
+    a = triangles[:, 0]
+    corners = [heights[_flat(triangles[:, i], grid_size)] for i in range(3)]
+
+    # Triangles of a level come in a few shapes, each covering the same
+    # samples relative to its corner a
+    shapes, group = np.unique(
+        (triangles[:, 1:] - a[:, None]).reshape(-1, 4), axis=0, return_inverse=True
+    )
+    group = group.ravel()
+
+    errors = np.empty(len(triangles))
+    for k, (bx, by, cx, cy) in enumerate(shapes):
+        dx, dy = np.meshgrid(
+            np.arange(min(0, bx, cx), max(0, bx, cx) + 1),
+            np.arange(min(0, by, cy), max(0, by, cy) + 1),
+        )
+        dx, dy = dx.ravel(), dy.ravel()
+
+        # Barycentric weights of the samples in the triangle's bounding box
+        det = bx * cy - by * cx
+        wb = (dx * cy - dy * cx) / det
+        wc = (bx * dy - by * dx) / det
+        wa = 1 - wb - wc
+        inside = (wa >= -1e-9) & (wb >= -1e-9) & (wc >= -1e-9)
+        offsets = (dy * grid_size + dx)[inside]
+        wa, wb, wc = wa[inside], wb[inside], wc[inside]
+
+        members = np.flatnonzero(group == k)
+        samples = heights[_flat(a[members], grid_size)[:, None] + offsets]
+        interpolated = (
+            corners[0][members, None] * wa
+            + corners[1][members, None] * wb
+            + corners[2][members, None] * wc
+        )
+        errors[members] = np.abs(samples - interpolated).max(axis=1)
+
+    return errors
+
+
+def rtin_errors(height_data):
+    """
+    Computes the RTIN error of every grid sample.
+
+    Every sample splits the hypotenuse of one or two triangles of the RTIN
+    hierarchy. Its error is the largest vertical distance between those
+    triangles and the samples they cover, raised to the errors of the
+    samples that split their children. Refining a triangle only where its
+    error exceeds a threshold therefore bounds the error of every sample,
+    and always refines the neighbour across the hypotenuse too, so the mesh
+    has no cracks.
+
+    Parameters:
+        height_data (numpy.ndarray): (2^k + 1, 2^k + 1) heights.
+
+    Returns:
+        numpy.ndarray: Errors with the same shape as height_data.
+    """
+    grid_size = height_data.shape[0]
+    tile_size = grid_size - 1
+    if height_data.shape != (grid_size, grid_size) or tile_size & (tile_size - 1):
+        raise ValueError("RTIN needs a square grid of 2^k + 1 samples per side.")
+
+    heights = np.asarray(height_data, dtype=np.float64).ravel()
+    errors = np.zeros(grid_size * grid_size)
+
+    # Every level of the triangle hierarchy that can still be split, top-down;
+    # below it, hypotenuse midpoints fall between samples
+    levels = [_root_triangles(tile_size)]
+    while True:
+        children = _split(levels[-1])
+        a, c = children[:, 0], children[:, 2]
+        if np.abs(a - c).sum(axis=1).max() <= 1:
+            break
+        levels.append(children)
+
+    # Bottom-up, so children's errors are final before their parents read them
+    for level, triangles in reversed(list(enumerate(levels))):
+        a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+        middle = _flat((a + b) >> 1, grid_size)
+        error = _triangle_errors(triangles, heights, grid_size)
+
+        if level < len(levels) - 1:
+            left_child = _flat((a + c) >> 1, grid_size)
+            right_child = _flat((b + c) >> 1, grid_size)
+            children = np.maximum(errors[left_child], errors[right_child])
+            error = np.maximum(error, children)
+
+        np.maximum.at(errors, middle, error)
+
+    return errors.reshape(grid_size, grid_size)
+
+
+def rtin_faces(height_data, max_error, errors=None):
+    """
+    Triangulates a heightmap adaptively, as a right-triangulated irregular network.
+
+    Triangles are split along their hypotenuse only while the split sample's
+    error exceeds `max_error`, so flat areas keep large triangles while every
+    sample is guaranteed to stay within `max_error` of the mesh surface
+    (vertically).
+
+    Parameters:
+        height_data (numpy.ndarray): (2^k + 1, 2^k + 1) heights.
+        max_error (float): Largest vertical distance allowed between a
+            sample and the mesh.
+        errors (numpy.ndarray): Precomputed rtin_errors(height_data), to reuse
+            them across several thresholds.
+
+    Returns:
+        numpy.ndarray: (F, 3) indices into the row-major grid samples, wound
+        like grid_faces.
+    """
+    if errors is None:
+        errors = rtin_errors(height_data)
+    grid_size = height_data.shape[0]
+    errors = errors.ravel()
+
+    kept = []
+    triangles = _root_triangles(grid_size - 1)
+    while len(triangles):
+        a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+        middle = _flat((a + b) >> 1, grid_size)
+        split = (np.abs(a - c).sum(axis=1) > 1) & (errors[middle] > max_error)
+
+        kept.append(triangles[~split])
+        triangles = _split(triangles[split])
+
+    triangles = np.concatenate(kept)
+
+    # Wind every face like grid_faces, whose normals point down the z axis
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    ab, ac = b - a, c - a
+    flip = ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0] > 0
+    triangles[flip] = triangles[flip][:, [0, 2, 1]]
+
+    return _flat(triangles, grid_size)
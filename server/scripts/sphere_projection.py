@@ -0,0 +1,187 @@
+from functools import lru_cache
+
+import numpy as np
+
+
+def map_to_sphere(vertices, theta_bounds, phi_bounds, R):
+    """
+    Maps a flat tile's vertices onto a spherical tile.
+
+    Parameters:
+        vertices (numpy.ndarray): Array of vertices to be mapped.
+        theta_bounds (tuple): Latitude bounds (theta_min, theta_max).
+        phi_bounds (tuple): Longitude bounds (phi_min, phi_max).
+        R (float): Radius of the sphere.
+
+    Returns:
+        numpy.ndarray: Array of vertices mapped onto the spherical tile.
+    """
+    x, y, z = vertices[:, 0], vertices[:, 1], vertices[:, 2]
+
+    # Scale x and y to longitude and latitude ranges
+    phi = phi_bounds[0] + x * (phi_bounds[1] - phi_bounds[0])
+    theta = theta_bounds[0] + y * (theta_bounds[1] - theta_bounds[0])
+
+    # Project onto sphere (preserving z as height for topography)
+    new_x = (R + z) * np.sin(theta) * np.cos(phi)
+    new_y = (R + z) * np.sin(theta) * np.sin(phi)
+    new_z = (R + z) * np.cos(theta)
+
+    return np.column_stack((new_x, new_y, new_z))
+
+
+def tiling(N):
+    """
+    Splits N tiles into latitude bands.
+
+    Returns:
+        tuple: (M, N_per_band), the number of bands and of tiles per band.
+    """
+    M = int(np.sqrt(N))  # Number of latitude bands
+    N_per_band = int(N / M)  # Number of tiles per latitude band
+    return M, N_per_band
+
+
+def slot_bounds(slot, M, N_per_band):
+    """
+    Returns the (theta_bounds, phi_bounds) of a slot, counted band by band.
+    """
+    theta_edges = np.linspace(0, np.pi, M + 1)  # Latitude edges
+    phi_edges = np.linspace(0, 2 * np.pi, N_per_band + 1)  # Longitude edges
+    lat_idx, lon_idx = divmod(slot, N_per_band)
+
+    return (
+        (theta_edges[lat_idx], theta_edges[lat_idx + 1]),
+        (phi_edges[lon_idx], phi_edges[lon_idx + 1]),
+    )
+
+
+@lru_cache(maxsize=64)
+def slot_directions(shape, M, N_per_band, slot):
+    """
+    Unit directions of every sample of a (rows, cols) tile grid placed in a slot.
+
+    Every landscape shares the same x/y grid, so these only depend on the grid
+    shape and the slot. The cache holds 64 slots (about 2 MB each for a
+    300x300 grid), enough for a full 7x7 planet.
+
+    Returns:
+        numpy.ndarray: (rows * cols, 3) read-only array, row-major over the grid.
+    """
+    rows, cols = shape
+    theta_bounds, phi_bounds = slot_bounds(slot, M, N_per_band)
+
+    phi = phi_bounds[0] + np.linspace(0, 1, cols) * (phi_bounds[1] - phi_bounds[0])
+    theta = theta_bounds[0] + np.linspace(0, 1, rows) * (
+        theta_bounds[1] - theta_bounds[0]
+    )
+
+    # theta only varies along rows and phi along columns
+    directions = np.empty((rows, cols, 3))
+    directions[:, :, 0] = np.sin(theta)[:, None] * np.cos(phi)[None, :]
+    directions[:, :, 1] = np.sin(theta)[:, None] * np.sin(phi)[None, :]
+    directions[:, :, 2] = np.cos(theta)[:, None]
+
+    directions = directions.reshape(-1, 3)
+    directions.flags.writeable = False
+    return directions
+
+
+def grid_index(vertices, tolerance=1e-6):
+    """
+    Locates a tile's vertices on the regular [0, 1] x/y landscape grid.
+
+    Parameters:
+        vertices (numpy.ndarray): (V, 3) tile vertices, in any order.
+        tolerance (float): How far x/y may stray from the grid (STL stores float32).
+
+    Returns:
+        tuple: ((rows, cols), flat_index) where flat_index[k] is the row-major
+        grid sample under vertex k (None when the vertices are already in
+        row-major grid order), or None if the tile is not a regular grid.
+    """
+    if len(vertices) == 0:
+        return None
+
+    x, y = vertices[:, 0], vertices[:, 1]
+    cols = len(np.unique(x))
+    rows = len(np.unique(y))
+    if cols < 2 or rows < 2:
+        return None
+
+    ix = np.rint(x * (cols - 1))
+    iy = np.rint(y * (rows - 1))
+    if (
+        np.abs(ix / (cols - 1) - x).max() > tolerance
+        or np.abs(iy / (rows - 1) - y).max() > tolerance
+    ):
+        return None
+
+    flat_index = iy.astype(np.intp) * cols + ix.astype(np.intp)
+    if len(flat_index) == rows * cols and np.array_equal(
+        flat_index, np.arange(rows * cols)
+    ):
+        flat_index = None
+
+    return (rows, cols), flat_index
+
+
+def to_grid_order(vertices, faces):
+    """
+    Reorders a tile's vertices into row-major grid order, remapping its faces.
+
+    Projecting a tile in grid order needs no gather from the cached directions,
+    which matters when one tile is projected into many slots.
+
+    Returns:
+        tuple: (vertices, faces, index), with index ready for project_tile. The
+        tile is returned unchanged when it is not a complete regular grid.
+    """
+    index = grid_index(vertices)
+    if index is None or index[1] is None:
+        return vertices, faces, index
+
+    shape, flat_index = index
+    samples = shape[0] * shape[1]
+    if len(flat_index) != samples or np.bincount(flat_index, minlength=samples).max() > 1:
+        # Missing or duplicated samples: not a permutation of the grid
+        return vertices, faces, index
+
+    ordered = np.empty_like(vertices)
+    ordered[flat_index] = vertices
+
+    return ordered, flat_index[faces], (shape, None)
+
+
+def project_tile(vertices, slot, M, N_per_band, R, index=None):
+    """
+    Projects a tile into a slot of the sphere.
+
+    Tiles on the shared landscape grid use the cached unit directions, so the
+    projection is a single (R + z) * direction product; other tiles fall back
+    to map_to_sphere.
+
+    Parameters:
+        vertices (numpy.ndarray): (V, 3) tile vertices.
+        slot (int): Slot index, counted band by band.
+        M (int): Number of latitude bands.
+        N_per_band (int): Number of tiles per latitude band.
+        R (float): Radius of the sphere.
+        index: The result of grid_index(vertices), to reuse it across slots.
+
+    Returns:
+        numpy.ndarray: (V, 3) projected vertices.
+    """
+    if index is None:
+        index = grid_index(vertices)
+
+    if index is None:
+        theta_bounds, phi_bounds = slot_bounds(slot, M, N_per_band)
+        return map_to_sphere(vertices, theta_bounds, phi_bounds, R)
+
+    shape, flat_index = index
+    directions = slot_directions(shape, M, N_per_band, slot)
+    if flat_index is not None:
+        directions = directions[flat_index]
+
+    return (R + vertices[:, 2])[:, None] * directions
@@ -0,0 +1,200 @@
+from pathlib import Path
+
+import numpy as np
+
+# One binary STL triangle: normal, three corners and the attribute byte count
+STL_DTYPE = np.dtype(
+    [("normal", "<f4", (3,)), ("vectors", "<f4", (3, 3)), ("attr", "<u2")]
+)
+HEADER_SIZE = 84  # 80-byte header + uint32 triangle count
+
+# Triangles filled per step when writing, to bound the temporaries
+CHUNK_SIZE = 1 << 16
+
+# Cross products shorter than this get a zero unit normal (trimesh's tolerance)
+ZERO_AREA = 1e-13
+
+
+def read_stl(stl_path, mode="r"):
+    """
+    Maps a binary STL file's triangles without reading or copying them.
+
+    Parameters:
+        stl_path (str): Path to a binary STL file.
+        mode (str): np.memmap mode, "r" for read-only or "r+" to edit in place.
+
+    Returns:
+        numpy.memmap: Structured array of STL_DTYPE records, one per triangle
+        (index its "vectors" field for the (F, 3, 3) corners).
+    """
+    stl_path = Path(stl_path)
+    size = stl_path.stat().st_size
+    with open(stl_path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+
+    if len(header) < HEADER_SIZE:
+        raise ValueError(f"{stl_path} is too short to be a binary STL file.")
+    count = int(np.frombuffer(header, "<u4", count=1, offset=80)[0])
+    if size != HEADER_SIZE + count * STL_DTYPE.itemsize:
+        raise ValueError(
+            f"{stl_path} is not a binary STL file ({count} triangles in the "
+            f"header, {size} bytes on disk)."
+        )
+
+    if count == 0:
+        return np.zeros(0, dtype=STL_DTYPE)
+    return np.memmap(
+        stl_path, dtype=STL_DTYPE, mode=mode, offset=HEADER_SIZE, shape=(count,)
+    )
+
+
+def stl_header(triangle_count: int, header: bytes = b"") -> bytes:
+    """The 84 bytes preceding the triangles: 80-byte header and triangle count."""
+    return header[:80].ljust(80, b"\0") + np.uint32(triangle_count).tobytes()
+
+
+def stl_size(triangle_count: int) -> int:
+    """Size in bytes of a binary STL file with this many triangles."""
+    return HEADER_SIZE + triangle_count * STL_DTYPE.itemsize
+
+
+def fill_records(records, vertices, faces, unit_normals: bool = False):
+    """
+    Fills STL records from an indexed mesh.
+
+    Normals are either `cross(v1 - v0, v2 - v0)` computed in float32, as
+    numpy-stl writes them, or unit normals, as trimesh writes them.
+    """
+    corners = vertices[faces]
+    records["vectors"] = corners
+
+    if unit_normals:
+        corners = np.asarray(corners, dtype=np.float64)
+        normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        lengths = np.sqrt(np.dot(normals * normals, [1.0, 1.0, 1.0]))
+        # Like trimesh, (near) degenerate triangles get a zero normal
+        valid = lengths > ZERO_AREA
+        normals[~valid] = 0
+        normals[valid] *= (1 / lengths[valid])[:, None]
+    else:
+        stored = records["vectors"]
+        normals = np.cross(stored[:, 1] - stored[:, 0], stored[:, 2] - stored[:, 0])
+
+    records["normal"] = normals
+    records["attr"] = 0
+
+
+class StlWriter:
+    """
+    Writes a binary STL file of a known size straight into a memory map.
+
+    The file is allocated up front, then each `write` call fills the next
+    triangles chunk by chunk from indexed vertices and faces, so no
+    (F, 3, 3) copy of the whole mesh ever exists in memory.
+    """
+
+    def __init__(self, output_path, triangle_count: int, header: bytes = b""):
+        self.output_path = Path(output_path)
+        self.triangle_count = triangle_count
+        self.written = 0
+
+        with open(self.output_path, "wb") as f:
+            f.write(stl_header(triangle_count, header))
+            f.truncate(stl_size(triangle_count))
+
+        self.records = (
+            np.memmap(
+                self.output_path,
+                dtype=STL_DTYPE,
+                mode="r+",
+                offset=HEADER_SIZE,
+                shape=(triangle_count,),
+            )
+            if triangle_count
+            else np.zeros(0, dtype=STL_DTYPE)
+        )
+
+    def write(self, vertices, faces, unit_normals: bool = False):
+        """Appends the triangles of an indexed mesh."""
+        faces = np.asarray(faces)
+        if self.written + len(faces) > self.triangle_count:
+            raise ValueError(
+                f"{self.output_path} was allocated for {self.triangle_count} triangles."
+            )
+
+        for start in range(0, len(faces), CHUNK_SIZE):
+            chunk = faces[start : start + CHUNK_SIZE]
+            fill_records(
+                self.records[self.written : self.written + len(chunk)],
+                vertices,
+                chunk,
+                unit_normals,
+            )
+            self.written += len(chunk)
+
+    def close(self):
+        if self.written != self.triangle_count:
+            raise ValueError(
+                f"{self.output_path} expected {self.triangle_count} triangles, "
+                f"got {self.written}."
+            )
+        if isinstance(self.records, np.memmap):
+            self.records.flush()
+        self.records = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.records = None
+
+
+def write_stl(output_path, vertices, faces, unit_normals: bool = False, header=b""):
+    """
+    Writes an indexed mesh as a binary STL file.
+
+    Parameters:
+        output_path (str): Path where the STL file will be saved.
+        vertices (numpy.ndarray): (V, 3) vertex positions.
+        faces (numpy.ndarray): (F, 3) vertex indices.
+        unit_normals (bool): Write unit normals rather than numpy-stl's
+            unnormalized cross products.
+        header (bytes): Up to 80 bytes of header text.
+
+    Returns:
+        None
+    """
+    with StlWriter(output_path, len(faces), header) as writer:
+        writer.write(vertices, faces, unit_normals)
+
+
+def iter_stl(
+    parts, unit_normals: bool = False, header: bytes = b"", chunk_size=CHUNK_SIZE
+):
+    """
+    Yields a binary STL file in pieces, one chunk of triangles at a time.
+
+    The triangle count is known from the faces up front, so the header is
+    correct from the first byte and the file never has to exist in full.
+
+    Parameters:
+        parts (list): (vertices, faces) pairs, written one after the other.
+        unit_normals (bool): Write unit normals rather than numpy-stl's
+            unnormalized cross products.
+        header (bytes): Up to 80 bytes of header text.
+        chunk_size (int): Triangles per yielded piece.
+
+    Yields:
+        bytes: The header, then successive runs of triangle records.
+    """
+    yield stl_header(sum(len(faces) for _, faces in parts), header)
+
+    records = np.empty(chunk_size, dtype=STL_DTYPE)
+    for vertices, faces in parts:
+        for start in range(0, len(faces), chunk_size):
+            chunk = faces[start : start + chunk_size]
+            fill_records(records[: len(chunk)], vertices, chunk, unit_normals)
+            yield records[: len(chunk)].tobytes()
@@ -0,0 +1,223 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import trimesh
+
+from scripts.stl_io import read_stl
+
+
+def indexed_path(stl_path):
+    """Returns where the indexed twin of a landscape STL is written."""
+    return Path(stl_path).with_suffix(".npz")
+
+
+def indexed_arrays(vertices, faces):
+    """A tile's arrays as stored on disk: float32 vertices and int32 faces."""
+    return (
+        np.asarray(vertices, dtype=np.float32),
+        np.asarray(faces, dtype=np.int32),
+    )
+
+
+def save_indexed_mesh(output_path, vertices, faces):
+    """
+    Saves a tile as shared vertices plus faces.
+
+    Vertices are stored as float32, exactly as the STL stores them, so loading
+    either file gives the same tile.
+
+    Parameters:
+        output_path (str): Path where the .npz file will be saved.
+        vertices (numpy.ndarray): (V, 3) vertex positions.
+        faces (numpy.ndarray): (F, 3) vertex indices.
+
+    Returns:
+        None
+    """
+    vertices, faces = indexed_arrays(vertices, faces)
+    with open(output_path, "wb") as f:
+        np.savez(f, vertices=vertices, faces=faces)
+
+
+def weld(triangles):
+    """
+    Merges the repeated corners of an STL triangle soup into shared vertices.
+
+    STL stores every corner of every triangle, so a grid sample shows up once
+    per triangle touching it. Corners are merged when their float32
+    coordinates are identical, which is how the same sample is written each
+    time.
+
+    Parameters:
+        triangles (numpy.ndarray): (F, 3, 3) triangle corners.
+
+    Returns:
+        tuple: (vertices, faces), the unique corners and (F, 3) indices into them.
+    """
+    corners = np.ascontiguousarray(triangles, dtype=np.float32).reshape(-1, 3)
+    corners = corners + np.float32(0)  # Turn -0.0 into 0.0 so they compare equal
+
+    # Compare corners as 12-byte records rather than row by row
+    records = corners.view(np.dtype((np.void, corners.dtype.itemsize * 3))).ravel()
+    _, first, inverse = np.unique(records, return_index=True, return_inverse=True)
+
+    return corners[first], inverse.reshape(-1, 3).astype(np.int32)
+
+
+def read_tile_mesh(stl_path):
+    """
+    Reads a landscape tile as indexed arrays with one vertex per grid sample.
+
+    Uses the indexed twin written by the landscape stage when it is at least as
+    new as the STL, and otherwise welds the STL itself (legacy landscapes).
+
+    Parameters:
+        stl_path (str): Path to the landscape STL.
+
+    Returns:
+        tuple: (vertices, faces) as float32 and int32 arrays.
+    """
+    stl_path = Path(stl_path)
+    npz_path = indexed_path(stl_path)
+
+    if npz_path.exists() and npz_path.stat().st_mtime >= stl_path.stat().st_mtime:
+        with np.load(npz_path) as data:
+            return data["vertices"], data["faces"]
+
+    return weld(read_stl(stl_path)["vectors"])
+
+
+class TileMeshCache:
+    """
+    Parsed landscape tiles, kept in memory across planet builds.
+
+    Entries are keyed by path, modification time and size, so a landscape that
+    is re-uploaded is simply read again. The least recently used tiles are
+    dropped once the arrays take more than `max_bytes`. `prefetch` reads the
+    missing tiles of a planet on a thread pool, so rebuilding a planet only
+    pays for I/O on the tiles that are new since the last build.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 2**20, max_workers: int = 8):
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _key(stl_path):
+        stat = os.stat(stl_path)
+        return (os.path.normpath(str(stl_path)), stat.st_mtime_ns, stat.st_size)
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _store(self, key, vertices, faces):
+        vertices.flags.writeable = False
+        faces.flags.writeable = False
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (vertices, faces)
+            self.nbytes += vertices.nbytes + faces.nbytes
+            self._evict()
+
+    def _evict(self):
+        # Keep at least the newest entry, even if it alone is over budget
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            _, (vertices, faces) = self._entries.popitem(last=False)
+            self.nbytes -= vertices.nbytes + faces.nbytes
+
+    def resize(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def arrays(self, stl_path):
+        """Returns the tile's read-only (vertices, faces) arrays."""
+        key = self._key(stl_path)
+        entry = self._lookup(key)
+        if entry is None:
+            entry = read_tile_mesh(stl_path)
+            self._store(key, *entry)
+        return entry
+
+    def put(self, stl_path, vertices, faces):
+        """Caches a tile that was just written, from the arrays it was written from."""
+        self._store(self._key(stl_path), *indexed_arrays(vertices, faces))
+
+    def get(self, stl_path) -> trimesh.Trimesh:
+        """Returns the tile as a mesh with shared vertices."""
+        vertices, faces = self.arrays(stl_path)
+        return trimesh.Trimesh(vertices=vertices, faces=faces, process=False)
+
+    def prefetch(self, stl_paths):
+        """
+        Reads the tiles that are not cached yet, in parallel.
+
+        Tiles that fail to load are skipped here; reading them again with `get`
+        raises the error where the caller can report it.
+        """
+        missing = []
+        for stl_path in stl_paths:
+            try:
+                key = self._key(stl_path)
+            except OSError:
+                continue
+            with self._lock:
+                if key not in self._entries:
+                    missing.append(stl_path)
+
+        def load(stl_path):
+            try:
+                self.arrays(stl_path)
+            except Exception:
+                pass
+
+        if len(missing) > 1:
+            with ThreadPoolExecutor(min(self.max_workers, len(missing))) as pool:
+                list(pool.map(load, missing))
+        elif missing:
+            load(missing[0])
+
+
+tile_cache = TileMeshCache()
+
+
+def load_tile_mesh(stl_path):
+    """
+    Loads a landscape tile as an indexed mesh with one vertex per grid sample.
+
+    Goes straight to disk; use `tile_cache.get` for tiles that are read again
+    and again, like those of the collective planet.
+
+    Parameters:
+        stl_path (str): Path to the landscape STL.
+
+    Returns:
+        trimesh.Trimesh: The tile, with shared vertices.
+    """
+    vertices, faces = read_tile_mesh(stl_path)
+    return trimesh.Trimesh(vertices=vertices, faces=faces, process=False)